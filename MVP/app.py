@@ -1,19 +1,36 @@
-import pandas as pd
 import numpy as np
-from scipy.stats import multivariate_normal, gmean
-from flask import Flask, render_template, request, jsonify, make_response
+from scipy.stats import norm
+from flask import Flask, Response, render_template, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS, cross_origin
 from pathlib import Path
 import json
-from load_data import load_data
+import logging
+import os
+import embedding
+from extract_information import (
+    events_from_results,
+    get_weighted_means,
+    query_data,
+    query_data_many,
+    results_to_deltas,
+    summarize_results,
+)
+from build_model import load_scorer, load_windows
+from load_data import get_collection, get_collection_version, sync_events_csv
+from observability import configure_logging, metrics, timed
+from query_cache import QueryCache
+from scoring import get_likelihood, get_likelihoods
+from simulate import simulate
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
-# Load and prepare data
-data = pd.read_csv("data/extended_economic_data.csv", usecols=[i for i in range(5, 21)])
-print("Columns in the dataset:", data.columns)
-mean = data.mean().values
-cov = data.cov().values
-gaussian = multivariate_normal(mean, cov, allow_singular=True)
-mean_pdf = gaussian.pdf(mean)
+# Prebuilt by build_model.py (mean, covariance factor, column order), only
+# rebuilt here if extended_economic_data.csv changed since
+gaussian = load_scorer()
+
+# Rolling / expanding window Gaussians for scoring "as of" a date, loaded on first use
+windowed_gaussians = None
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -30,8 +47,23 @@ CORS(
     },
 )
 
-# Load MongoDB client and collection
-client, collection = load_data()
+# Load MongoDB client and collection, the events are only ingested here if the
+# collection is empty (or SYNC_EVENTS_ON_STARTUP is set), otherwise run load_data.py
+client, collection = get_collection()
+if collection.count() == 0 or os.getenv("SYNC_EVENTS_ON_STARTUP"):
+    sync_events_csv(collection)
+
+# Repeated scenario texts are answered from here instead of embedding + Chroma
+query_cache = QueryCache(
+    max_size=int(os.getenv("QUERY_CACHE_SIZE", 256)),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", 3600)),
+)
+
+# Upper bound on the scenarios in one /process_queries request
+MAX_QUERIES = int(os.getenv("MAX_QUERIES_PER_REQUEST", 64))
+
+# Upper bound on n_paths per /simulate request
+SIMULATION_MAX_PATHS = int(os.getenv("SIMULATION_MAX_PATHS", 10_000_000))
 
 # Base values for all metrics
 BASE_VALUES = {
@@ -61,16 +93,12 @@ def convert_to_absolute(row):
         transformed_row["CPI"] = BASE_VALUES["CPI"] + (
             BASE_VALUES["CPI"] * row["CPI"] / 100
         )
-        print(transformed_row["CPI"])
     return transformed_row
 
 
 def convert_metrics_to_absolute(metrics):
     absolute_metrics = metrics.copy()
 
-    print("metrics:")
-    print(metrics)
-
     for key, value in metrics.items():
         # Handle GDP metrics
         if "gdp" in key.lower():
@@ -101,30 +129,385 @@ def add_cors_headers(response):
     return response
 
 
-# the bigger this magnitude number the more unlikely it is
-def get_likelihood(pdf_ratio):
-    # Handle edge cases
-    if np.isinf(pdf_ratio) or pdf_ratio > 1e308:  # Close to max float value
-        return "Extremely Unlikely"
-    if pdf_ratio <= 0:
-        return "Extremely Unlikely"
+# Turn a list of economic_params rows (dicts like /calculate_pdf takes, or plain
+# lists of numbers) into an N x 16 matrix. Dict rows have to name exactly the
+# model's columns. Rows that can't be used are reported in errors and left out
+# of the matrix.
+def params_to_matrix(rows, scorer=None):
+    scorer = scorer or gaussian
+    n_params = len(scorer.mean)
+    vectors = []
+    valid_rows = []
+    errors = []
+
+    for i, row in enumerate(rows):
+        try:
+            if isinstance(row, dict):
+                row = row.get("economic_params", row)
+            if isinstance(row, dict):
+                vector = scorer.vector(row, strict=True)
+            else:
+                vector = np.array(row, dtype=float)
+            if vector.shape != (n_params,):
+                raise ValueError(
+                    f"expected {n_params} economic params, got shape {vector.shape}"
+                )
+            if not np.all(np.isfinite(vector)):
+                raise ValueError("economic params must be finite numbers")
+        except (TypeError, ValueError) as error:
+            errors.append({"row": i, "error": str(error)})
+            continue
+        vectors.append(vector)
+        valid_rows.append(i)
+
+    matrix = np.array(vectors, dtype=float).reshape(len(vectors), n_params)
+    return matrix, valid_rows, errors
+
+
+# Read the rows of a batch request, either JSON {"economic_params": [...]} or
+# NDJSON with one row per line. Raises ValueError if a JSON body isn't valid or
+# has no economic_params list (bad NDJSON lines are per row errors instead).
+def read_batch_rows(mimetype, body):
+    if mimetype in ("application/x-ndjson", "application/jsonl"):
+        rows = []
+        errors = []
+        for i, line in enumerate(body.splitlines()):
+            if not line.strip():
+                continue
+            try:
+                rows.append((i, json.loads(line)))
+            except json.JSONDecodeError as error:
+                errors.append({"row": i, "error": f"invalid JSON: {error.msg}"})
+        return rows, errors
 
     try:
-        magnitude = -int(np.floor(np.log10(pdf_ratio)))
-    except (OverflowError, ValueError):
-        return "Extremely Unlikely"
-
-    # Define categories based on magnitude
-    if magnitude >= 200:
-        return "Extremely Unlikely"
-    elif magnitude >= 50:
-        return "Very Unlikely"
-    elif magnitude >= 20:
-        return "Unlikely"
-    elif magnitude >= 10:
-        return "Neutral"
-    else:
-        return "Likely"
+        params = json.loads(body)["economic_params"]
+    except json.JSONDecodeError as error:
+        raise ValueError(f"invalid JSON: {error.msg}") from error
+    except (KeyError, TypeError) as error:
+        raise ValueError('body must be {"economic_params": [...]}') from error
+    if not isinstance(params, list):
+        raise ValueError("economic_params must be a list of rows")
+    return list(enumerate(params)), []
+
+
+# The request handlers below are plain functions of the request data, so the
+# Flask routes here and the async ones in asgi.py share them
+
+
+# The Gaussian to score against: the one fitted on all data, or with as_of the
+# one fitted on the window_years before as_of (all data up to as_of without
+# window_years). Raises ValueError for bad dates or too small windows.
+def scorer_for(as_of=None, window_years=None):
+    global windowed_gaussians
+    if as_of is None:
+        if window_years is not None:
+            raise ValueError("window_years needs as_of")
+        return gaussian
+    if windowed_gaussians is None:
+        windowed_gaussians = load_windows()
+    return windowed_gaussians.as_of(
+        as_of, None if window_years is None else float(window_years)
+    )
+
+
+def score_economic_params(economic_params, scorer=None):
+    scorer = scorer or gaussian
+    vector = scorer.vector(economic_params)
+    # print("Received economic parameters:\n", vector)
+
+    log_pdf_ratio = float(scorer.log_pdf_ratio(vector))
+    pdf_value = float(scorer.pdf(vector))
+    pdf_ratio = float(np.exp(log_pdf_ratio))
+
+    # print("Calculated PDF value:", pdf_value)
+    # print("PDF Ratio to Mean:", pdf_ratio)
+
+    likelihood = get_likelihood(log_pdf_ratio)
+    return {
+        "pdf_ratio": pdf_ratio,
+        "pdf_value": pdf_value,
+        "log_pdf_ratio": log_pdf_ratio,
+        "likelihood": likelihood,
+    }
+
+
+def score_batch(indexed_rows, errors, scorer=None):
+    scorer = scorer or gaussian
+    row_numbers = [i for i, _ in indexed_rows]
+    matrix, valid_rows, row_errors = params_to_matrix(
+        [row for _, row in indexed_rows], scorer
+    )
+    for error in row_errors:
+        error["row"] = row_numbers[error["row"]]
+    errors = sorted(errors + row_errors, key=lambda error: error["row"])
+
+    # score every valid row in one pass
+    log_pdf_ratios = scorer.log_pdf_ratio(matrix)
+    pdf_values = np.exp(scorer.log_pdf_mean + log_pdf_ratios)
+    pdf_ratios = np.exp(log_pdf_ratios)
+    likelihoods = get_likelihoods(log_pdf_ratios)
+
+    n_rows = max(row_numbers + [error["row"] for error in errors], default=-1) + 1
+    result_pdf_ratios = [None] * n_rows
+    result_pdf_values = [None] * n_rows
+    result_log_pdf_ratios = [None] * n_rows
+    result_likelihoods = [None] * n_rows
+    for j, i in enumerate(valid_rows):
+        row = row_numbers[i]
+        result_pdf_ratios[row] = float(pdf_ratios[j])
+        result_pdf_values[row] = float(pdf_values[j])
+        result_log_pdf_ratios[row] = float(log_pdf_ratios[j])
+        result_likelihoods[row] = likelihoods[j]
+
+    return {
+        "pdf_ratio": result_pdf_ratios,
+        "pdf_value": result_pdf_values,
+        "log_pdf_ratio": result_log_pdf_ratios,
+        "likelihood": result_likelihoods,
+        "errors": errors,
+    }
+
+
+DEFAULT_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+# Given some of the economic params (e.g. only the 6m horizons), the distribution
+# of the others under the gaussian: conditional mean, covariance and quantiles
+def conditional_forecast(economic_params, quantiles=None, scorer=None):
+    scorer = scorer or gaussian
+    quantiles = DEFAULT_QUANTILES if quantiles is None else [float(q) for q in quantiles]
+    if not all(0 < q < 1 for q in quantiles):
+        raise ValueError("quantiles must be between 0 and 1")
+
+    columns, mean, cov = scorer.conditional(economic_params)
+    keys = [f"weighted_mean_{column}" for column in columns]
+    std = np.sqrt(np.clip(np.diag(cov), 0, None))
+    return {
+        "missing": keys,
+        "mean": dict(zip(keys, mean.tolist())),
+        "std": dict(zip(keys, std.tolist())),
+        "covariance": cov.tolist(),
+        "quantiles": {
+            str(q): dict(zip(keys, (mean + norm.ppf(q) * std).tolist()))
+            for q in quantiles
+        },
+    }
+
+
+# Where /simulate draws its paths around. mode "gaussian": the gaussian's own mean,
+# "centered": the query's weighted means (or the economic_params given instead),
+# "mixture": each of the query's analog events, picked by similarity score.
+# Returns (centers, weights), this is the part that may embed and query.
+def simulation_centers(data, scorer=None):
+    scorer = scorer or gaussian
+    mode = data.get("mode", "gaussian")
+    query = data.get("query")
+
+    if mode == "gaussian":
+        return None, None
+    if mode == "centered":
+        if "economic_params" in data:
+            params = data["economic_params"]
+        elif query:
+            params, _, _ = query_cache.get_or_compute(
+                query,
+                get_collection_version(collection),
+                lambda: get_weighted_means(query, collection),
+            )
+        else:
+            raise ValueError("mode centered needs a query or economic_params")
+        center = scorer.vector(params)
+        if center.shape != scorer.mean.shape or not np.all(np.isfinite(center)):
+            raise ValueError(f"expected {len(scorer.mean)} finite economic params")
+        return center, None
+    if mode == "mixture":
+        if not query:
+            raise ValueError("mode mixture needs a query")
+        deltas, scores = results_to_deltas(query_data(query, collection))
+        if len(deltas) == 0:
+            raise ValueError("no events found for the query")
+        # events without some metric are centered on the gaussian's mean there
+        deltas = np.where(np.isnan(deltas), scorer.mean, deltas)
+        return deltas, scores
+    raise ValueError(f"unknown mode {mode!r}, expected gaussian, centered or mixture")
+
+
+# Monte Carlo distribution of the deltas: mean, std, quantiles per column and
+# P(delta > threshold) for the columns given in thresholds
+def simulate_scenarios(data, centers=None, weights=None, scorer=None):
+    scorer = scorer or gaussian
+    n_paths = int(data.get("n_paths", 100_000))
+    if not 0 < n_paths <= SIMULATION_MAX_PATHS:
+        raise ValueError(f"n_paths must be between 1 and {SIMULATION_MAX_PATHS}")
+    quantiles = [float(q) for q in data.get("quantiles", [0.01, 0.05, 0.5, 0.95, 0.99])]
+    if not all(0 < q < 1 for q in quantiles):
+        raise ValueError("quantiles must be between 0 and 1")
+
+    thresholds = np.full(len(scorer.mean), np.nan)
+    for key, value in data.get("thresholds", {}).items():
+        column = key.removeprefix("weighted_mean_")
+        if column not in scorer.columns:
+            raise ValueError(f"unknown threshold column {key}")
+        thresholds[scorer.columns.index(column)] = float(value)
+
+    result = simulate(
+        scorer,
+        n_paths,
+        centers=centers,
+        weights=weights,
+        thresholds=thresholds,
+        quantiles=quantiles,
+        seed=int(data.get("seed", 0)),
+    )
+
+    keys = [f"weighted_mean_{column}" for column in scorer.columns]
+    return {
+        "n_paths": n_paths,
+        "mean": dict(zip(keys, result["mean"].tolist())),
+        "std": dict(zip(keys, result["std"].tolist())),
+        "quantiles": {
+            str(q): dict(zip(keys, values.tolist()))
+            for q, values in zip(quantiles, result["quantiles"])
+        },
+        "exceedance": {
+            key: float(p)
+            for key, p in zip(keys, result["exceedance"])
+            if not np.isnan(p)
+        },
+    }
+
+
+# Likelihood of the query's weighted means under the gaussian. log_pdf_ratio
+# can be passed in if it was already computed (see build_query_responses).
+def score_weighted_means(weighted_means, log_pdf_ratio=None):
+    if log_pdf_ratio is None:
+        with timed("score"):
+            # weighted_means are keyed by column, so they line up with the gaussian's order
+            log_pdf_ratio = gaussian.log_pdf_ratio(gaussian.vector(weighted_means))
+
+    log_pdf_ratio = float(log_pdf_ratio)
+    return {
+        "pdf_ratio": float(np.exp(log_pdf_ratio)),
+        "pdf_value": float(np.exp(gaussian.log_pdf_mean + log_pdf_ratio)),
+        "log_pdf_ratio": log_pdf_ratio,
+        "likelihood": get_likelihood(log_pdf_ratio),
+    }
+
+
+# The top result's trajectory as absolute values for the frontend
+def absolute_trajectory(limited_weighted_means):
+    # Update limited_weighted_means with absolute values
+    # Convert all metrics to absolute values
+    absolute_weighted_means = convert_metrics_to_absolute(limited_weighted_means)
+
+    absolute_weighted_means["weighted_mean_cpi_0m"] = BASE_VALUES["CPI"]
+
+    absolute_weighted_means["weighted_mean_gdp_0m"] = BASE_VALUES["GDP"]
+
+    absolute_weighted_means["weighted_mean_oil_price_0m"] = BASE_VALUES["Oil"]
+
+    absolute_weighted_means["weighted_mean_unemployment_rate_0m"] = BASE_VALUES[
+        "Unemployment"
+    ]
+
+    logger.debug(
+        "trajectory",
+        extra={
+            "fields": {
+                "absolute_weighted_means": absolute_weighted_means,
+                "relative_weighted_means": limited_weighted_means,
+            }
+        },
+    )
+    return absolute_weighted_means
+
+
+# Score the query's weighted means and turn the top result's trajectory into
+# absolute values for the frontend
+def build_query_response(weighted_means, events, limited_weighted_means, log_pdf_ratio=None):
+    return {
+        **score_weighted_means(weighted_means, log_pdf_ratio),
+        "events": events,  # Include the events in the response
+        **absolute_trajectory(limited_weighted_means),
+    }
+
+
+# One message of a streamed response, an NDJSON line or a server-sent event
+def stream_message(kind, payload, sse=False):
+    body = json.dumps({"type": kind, **payload})
+    return f"event: {kind}\ndata: {body}\n\n" if sse else body + "\n"
+
+
+def stream_format(accept, format=None):
+    return format == "sse" or (format is None and "text/event-stream" in (accept or ""))
+
+
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+# build_query_response for many summaries, with all weighted means scored in
+# one matrix product
+def build_query_responses(summaries):
+    with timed("score"):
+        matrix = np.array(
+            [gaussian.vector(weighted_means) for weighted_means, _, _ in summaries]
+        ).reshape(len(summaries), len(gaussian.mean))
+        log_pdf_ratios = gaussian.log_pdf_ratio(matrix)
+    return [
+        build_query_response(*summary, log_pdf_ratio=log_pdf_ratio)
+        for summary, log_pdf_ratio in zip(summaries, log_pdf_ratios)
+    ]
+
+
+# The texts of a /process_queries request, raises ValueError if it's not a list
+# of at most MAX_QUERIES strings
+def read_queries(data):
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        raise ValueError("queries must be a list of strings")
+    if len(queries) > MAX_QUERIES:
+        raise ValueError(f"at most {MAX_QUERIES} queries per request")
+    return queries
+
+
+# Cached summaries for the queries (None where there's none yet) and the distinct
+# queries that still have to be run
+def cached_summaries(queries, version):
+    summaries = [query_cache.get(query, version) for query in queries]
+    missing = list(dict.fromkeys(q for q, summary in zip(queries, summaries) if summary is None))
+    return summaries, missing
+
+
+# Summarize the results of the missing queries, cache them and fill them in
+def fill_summaries(queries, summaries, missing, results, version):
+    fetched = {}
+    for query, query_results in zip(missing, results):
+        fetched[query] = summarize_results(query_results)
+        query_cache.set(query, version, fetched[query])
+    return [
+        summary if summary is not None else fetched[query]
+        for query, summary in zip(queries, summaries)
+    ]
+
+
+def health():
+    return {
+        "status": "healthy",
+        "query_cache": query_cache.stats(),
+        "embedding": embedding.default_ef.stats(),
+    }
+
+
+# Prometheus text format: request counts, stage latencies, cache stats
+def render_metrics():
+    return metrics.render({
+        "query_cache": query_cache.stats(),
+        "embedding_cache": embedding.default_ef.stats(),
+    })
+
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
 
 
 @app.route("/calculate_pdf", methods=["POST", "OPTIONS"])
@@ -134,19 +517,58 @@ def calculate_pdf():
 
     # Extract economic parameters from the request
     economic_params = request.json["economic_params"]
-    vector = np.array(list(economic_params.values()), dtype=float)
-    # print("Received economic parameters:\n", vector)
+    try:
+        scorer = scorer_for(request.json.get("as_of"), request.json.get("window_years"))
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    return jsonify(score_economic_params(economic_params, scorer))
 
-    pdf_value = gaussian.pdf(vector)
-    pdf_ratio = pdf_value / mean_pdf if mean_pdf != 0 else 0
 
-    # print("Calculated PDF value:", pdf_value)
-    # print("PDF Ratio to Mean:", pdf_ratio)
+@app.route("/calculate_pdf_batch", methods=["POST", "OPTIONS"])
+def calculate_pdf_batch():
+    if request.method == "OPTIONS":
+        return "", 204
+
+    # as_of / window_years go in the query string, NDJSON has no place for them
+    try:
+        scorer = scorer_for(request.args.get("as_of"), request.args.get("window_years"))
+        indexed_rows, errors = read_batch_rows(
+            request.mimetype, request.get_data(as_text=True)
+        )
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    return jsonify(score_batch(indexed_rows, errors, scorer))
 
-    likelihood = get_likelihood(pdf_ratio)
-    return jsonify(
-        {"pdf_ratio": pdf_ratio, "pdf_value": pdf_value, "likelihood": likelihood}
-    )
+
+@app.route("/conditional_forecast", methods=["POST", "OPTIONS"])
+def conditional_forecast_route():
+    if request.method == "OPTIONS":
+        return "", 204
+
+    data = request.json
+    try:
+        scorer = scorer_for(data.get("as_of"), data.get("window_years"))
+        result = conditional_forecast(
+            data["economic_params"], data.get("quantiles"), scorer
+        )
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    return jsonify(result)
+
+
+@app.route("/simulate", methods=["POST", "OPTIONS"])
+def simulate_route():
+    if request.method == "OPTIONS":
+        return "", 204
+
+    data = request.json
+    try:
+        scorer = scorer_for(data.get("as_of"), data.get("window_years"))
+        centers, weights = simulation_centers(data, scorer)
+        result = simulate_scenarios(data, centers, weights, scorer)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    return jsonify(result)
 
 
 @app.route("/process_query", methods=["POST", "OPTIONS"])
@@ -158,55 +580,88 @@ def process_query():
     data = request.json
     query = data.get("query")
 
-    # Call the extract_information script
-    from extract_information import get_weighted_means
-
-    weighted_means, events, limited_weighted_means = get_weighted_means(
-        query, collection
+    weighted_means, events, limited_weighted_means = query_cache.get_or_compute(
+        query,
+        get_collection_version(collection),
+        lambda: get_weighted_means(query, collection),
     )
-    result_list = []
+    response = build_query_response(weighted_means, events, limited_weighted_means)
+    with timed("serialize"):
+        return jsonify(response)
 
-    for key, value in weighted_means.items():
-        result_list.append(value)
-    vector = np.array(result_list, dtype=float)
 
-    pdf_value = gaussian.pdf(vector)
-    pdf_ratio = pdf_value / mean_pdf if mean_pdf != 0 else 0
-    likelihood = get_likelihood(pdf_ratio)
+# Several scenarios at once: the ones not in the query cache are embedded in one
+# batch and retrieved with one multi-query call, and all are scored together
+@app.route("/process_queries", methods=["POST", "OPTIONS"])
+def process_queries():
+    if request.method == "OPTIONS":
+        return "", 204
 
-    # Update limited_weighted_means with absolute values
-    # Convert all metrics to absolute values
-    absolute_weighted_means = convert_metrics_to_absolute(limited_weighted_means)
+    try:
+        queries = read_queries(request.json)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+
+    version = get_collection_version(collection)
+    summaries, missing = cached_summaries(queries, version)
+    if missing:
+        results = query_data_many(missing, collection)
+        summaries = fill_summaries(queries, summaries, missing, results, version)
+    responses = build_query_responses(summaries)
+    with timed("serialize"):
+        return jsonify({"results": responses})
+
+
+# /process_query in three parts, sent as each is ready: "events" as soon as the
+# vector query returns, then "trajectory" (the absolute values) and finally
+# "likelihood". NDJSON, or server-sent events with ?format=sse or
+# Accept: text/event-stream.
+@app.route("/process_query_stream", methods=["POST", "OPTIONS"])
+def process_query_stream():
+    if request.method == "OPTIONS":
+        return "", 204
 
-    absolute_weighted_means["weighted_mean_cpi_0m"] = BASE_VALUES["CPI"]
+    query = request.json.get("query")
+    sse = stream_format(request.headers.get("Accept"), request.args.get("format"))
+
+    def generate():
+        version = get_collection_version(collection)
+        summary = query_cache.get(query, version)
+        if summary is None:
+            results = query_data(query, collection)
+            events = events_from_results(results)
+            yield stream_message("events", {"events": events}, sse)
+            summary = summarize_results(results, events)
+            query_cache.set(query, version, summary)
+        else:
+            yield stream_message("events", {"events": summary[1]}, sse)
+
+        weighted_means, _, limited_weighted_means = summary
+        yield stream_message("trajectory", absolute_trajectory(limited_weighted_means), sse)
+        yield stream_message("likelihood", score_weighted_means(weighted_means), sse)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream" if sse else "application/x-ndjson",
+        headers=STREAM_HEADERS,
+    )
 
-    absolute_weighted_means["weighted_mean_gdp_0m"] = BASE_VALUES["GDP"]
 
-    absolute_weighted_means["weighted_mean_oil_price_0m"] = BASE_VALUES["Oil"]
+@app.route("/health", methods=["GET"])
+def health_check():
+    return jsonify(health())
 
-    absolute_weighted_means["weighted_mean_unemployment_rate_0m"] = BASE_VALUES[
-        "Unemployment"
-    ]
 
-    print("absolute weighted means:")
-    print(absolute_weighted_means)
-    print("relative_weighted_means")
-    print(limited_weighted_means)
-
-    return jsonify(
-        {
-            "pdf_ratio": pdf_ratio,
-            "pdf_value": pdf_value,
-            "likelihood": likelihood,
-            "events": events,  # Include the events in the response
-            **absolute_weighted_means,
-        }
-    )
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
 
 
-@app.route("/health", methods=["GET"])
-def health_check():
-    return jsonify({"status": "healthy"})
+@app.after_request
+def count_request(response):
+    route = request.url_rule.rule if request.url_rule is not None else "other"
+    metrics.count_request(route, response.status_code)
+    return response
 
 
 # @app.errorhandler(Exception)
@@ -0,0 +1,246 @@
+# Async serving mode for the backend, run with
+#   uv run uvicorn asgi:app --host 0.0.0.0 --port 5000
+# Same routes and responses as app.py (which does the data loading and scoring),
+# but a request waiting on the OpenAI embedding / vector query doesn't hold a
+# worker: blocking I/O runs in one thread pool, Gaussian scoring and the
+# weighted-mean math in another, and the event loop keeps taking requests.
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as core
+from extract_information import events_from_results, query_data, query_data_many, summarize_results
+from load_data import get_collection_version
+from observability import metrics, timed
+
+# Concurrency limits: requests processed at once (the rest wait), threads for
+# embedding/retrieval calls, threads for CPU-bound scoring
+MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", 64))
+IO_THREADS = int(os.getenv("ASYNC_IO_THREADS", 32))
+CPU_THREADS = int(os.getenv("ASYNC_CPU_THREADS", 2))
+
+io_pool = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="io")
+cpu_pool = ThreadPoolExecutor(max_workers=CPU_THREADS, thread_name_prefix="cpu")
+in_flight = None
+
+
+async def run_io(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(io_pool, partial(fn, *args))
+
+
+async def run_cpu(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(cpu_pool, partial(fn, *args))
+
+
+def in_flight_limit():
+    global in_flight
+    if in_flight is None:
+        # created lazily so it belongs to the server's event loop
+        in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+    return in_flight
+
+
+def limit_in_flight(handler):
+    async def limited(request):
+        async with in_flight_limit():
+            return await handler(request)
+
+    return limited
+
+
+# Like flask.jsonify, lets NaN through (starlette's JSONResponse refuses it)
+class JSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content):
+        return json.dumps(content).encode("utf-8")
+
+
+@limit_in_flight
+async def calculate_pdf(request):
+    body = await request.json()
+    try:
+        # the first request for a window fits it, that's CPU work too
+        scorer = await run_cpu(core.scorer_for, body.get("as_of"), body.get("window_years"))
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    return JSONResponse(await run_cpu(core.score_economic_params, body["economic_params"], scorer))
+
+
+@limit_in_flight
+async def calculate_pdf_batch(request):
+    try:
+        scorer = await run_cpu(
+            core.scorer_for,
+            request.query_params.get("as_of"),
+            request.query_params.get("window_years"),
+        )
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    body = (await request.body()).decode("utf-8")
+    mimetype = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        indexed_rows, errors = core.read_batch_rows(mimetype, body)
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    return JSONResponse(await run_cpu(core.score_batch, indexed_rows, errors, scorer))
+
+
+@limit_in_flight
+async def conditional_forecast(request):
+    body = await request.json()
+    try:
+        scorer = await run_cpu(core.scorer_for, body.get("as_of"), body.get("window_years"))
+        result = await run_cpu(
+            core.conditional_forecast, body["economic_params"], body.get("quantiles"), scorer
+        )
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    return JSONResponse(result)
+
+
+@limit_in_flight
+async def simulate(request):
+    body = await request.json()
+    try:
+        scorer = await run_cpu(core.scorer_for, body.get("as_of"), body.get("window_years"))
+        # centered / mixture modes may embed and query the collection
+        centers, weights = await run_io(core.simulation_centers, body, scorer)
+        result = await run_cpu(core.simulate_scenarios, body, centers, weights, scorer)
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+    return JSONResponse(result)
+
+
+@limit_in_flight
+async def process_query(request):
+    query = (await request.json()).get("query")
+
+    # reads the version from the store (sqlite / records.json), not on the loop
+    version = await run_io(get_collection_version, core.collection)
+    summary = core.query_cache.get(query, version)
+    if summary is None:
+        # embedding + vector query, blocking network I/O
+        results = await run_io(query_data, query, core.collection)
+        summary = await run_cpu(summarize_results, results)
+        core.query_cache.set(query, version, summary)
+
+    response = await run_cpu(core.build_query_response, *summary)
+    with timed("serialize"):
+        return JSONResponse(response)
+
+
+@limit_in_flight
+async def process_queries(request):
+    try:
+        queries = core.read_queries(await request.json())
+    except ValueError as error:
+        return JSONResponse({"error": str(error)}, status_code=400)
+
+    version = await run_io(get_collection_version, core.collection)
+    summaries, missing = core.cached_summaries(queries, version)
+    if missing:
+        # one batched embedding + one multi-query vector search
+        results = await run_io(query_data_many, missing, core.collection)
+        summaries = await run_cpu(core.fill_summaries, queries, summaries, missing, results, version)
+    responses = await run_cpu(core.build_query_responses, summaries)
+    with timed("serialize"):
+        return JSONResponse({"results": responses})
+
+
+# Not wrapped in limit_in_flight: the handler returns as soon as the response
+# starts, the work happens in generate(), so that's what holds the slot
+async def process_query_stream(request):
+    query = (await request.json()).get("query")
+    sse = core.stream_format(request.headers.get("accept"), request.query_params.get("format"))
+
+    async def generate():
+        async with in_flight_limit():
+            version = await run_io(get_collection_version, core.collection)
+            summary = core.query_cache.get(query, version)
+            if summary is None:
+                results = await run_io(query_data, query, core.collection)
+                events = await run_cpu(events_from_results, results)
+                yield core.stream_message("events", {"events": events}, sse)
+                summary = await run_cpu(summarize_results, results, events)
+                core.query_cache.set(query, version, summary)
+            else:
+                yield core.stream_message("events", {"events": summary[1]}, sse)
+
+            weighted_means, _, limited_weighted_means = summary
+            trajectory = await run_cpu(core.absolute_trajectory, limited_weighted_means)
+            yield core.stream_message("trajectory", trajectory, sse)
+            likelihood = await run_cpu(core.score_weighted_means, weighted_means)
+            yield core.stream_message("likelihood", likelihood, sse)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers=core.STREAM_HEADERS,
+    )
+
+
+async def health_check(request):
+    return JSONResponse(core.health())
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(core.render_metrics(), headers={"Content-Type": core.METRICS_CONTENT_TYPE})
+
+
+# Counts every response by route and status for /metrics
+class CountRequests:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope["path"] if scope["path"] in ROUTE_PATHS else "other"
+            metrics.count_request(route, status)
+
+
+app = Starlette(
+    routes=[
+        Route("/calculate_pdf", calculate_pdf, methods=["POST"]),
+        Route("/calculate_pdf_batch", calculate_pdf_batch, methods=["POST"]),
+        Route("/conditional_forecast", conditional_forecast, methods=["POST"]),
+        Route("/simulate", simulate, methods=["POST"]),
+        Route("/process_query", process_query, methods=["POST"]),
+        Route("/process_queries", process_queries, methods=["POST"]),
+        Route("/process_query_stream", process_query_stream, methods=["POST"]),
+        Route("/health", health_check, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(CountRequests),
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_methods=["GET", "POST", "OPTIONS"],
+            allow_headers=["Content-Type"],
+        )
+    ],
+)
+
+ROUTE_PATHS = {route.path for route in app.routes}
@@ -0,0 +1,217 @@
+# Benchmarks for the hot paths, on fixed synthetic inputs and the CSVs in data/.
+#   uv run benchmark.py run --output before.json
+#   ... change things ...
+#   uv run benchmark.py run --output after.json
+#   uv run benchmark.py compare before.json after.json
+# compare exits with 1 if any benchmark got slower than --threshold.
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+# keep the embedding cache of a benchmark run out of the real one
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "benchmark_embeddings.sqlite3"))
+
+import numpy as np
+
+from build_model import SOURCE_COLUMNS, SOURCE_CSV
+from features import ECONOMIC_CSV, horizon_deltas, read_levels
+from scoring import GaussianScorer, get_likelihood, get_likelihoods
+
+SEED = 0
+WEIGHTED_MEAN_KS = [5, 10, 50, 100, 500, 1000]
+
+
+# Seconds per call of fn: calls are repeated until a round takes at least
+# min_time, and the best and median of `repeat` rounds are kept
+def measure(fn, repeat=5, min_time=0.05):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    rounds = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    return {"median_s": float(np.median(rounds)), "min_s": float(min(rounds)), "calls_per_round": number}
+
+
+def fitted_scorer():
+    values = np.loadtxt(SOURCE_CSV, delimiter=",", skiprows=1, usecols=SOURCE_COLUMNS)
+    return GaussianScorer(values.mean(axis=0), np.cov(values, rowvar=False))
+
+
+def synthetic_results(k, rng):
+    from extract_information import METRIC_FIELDS
+
+    values = rng.normal(size=(k, len(METRIC_FIELDS))) * 100
+    return [
+        {"id": str(i), "score": float(score), **dict(zip(METRIC_FIELDS, row.tolist()))}
+        for i, (score, row) in enumerate(zip(rng.uniform(0.1, 1, size=k), values))
+    ]
+
+
+def bench_weighted_means():
+    from extract_information import calculate_weighted_means
+
+    rng = np.random.default_rng(SEED)
+    for k in WEIGHTED_MEAN_KS:
+        results = synthetic_results(k, rng)
+        yield f"calculate_weighted_means[k={k}]", lambda results=results: calculate_weighted_means(results)
+
+
+def bench_gaussian():
+    scorer = fitted_scorer()
+    rng = np.random.default_rng(SEED)
+    single = rng.multivariate_normal(scorer.mean, scorer.cov)
+    yield "gaussian.pdf[single]", lambda: scorer.pdf(single)
+    for n in (1_000, 100_000):
+        batch = rng.multivariate_normal(scorer.mean, scorer.cov, size=n)
+        yield f"gaussian.pdf[batch={n}]", lambda batch=batch: scorer.pdf(batch)
+
+
+def bench_likelihood():
+    log_pdf_ratios = np.random.default_rng(SEED).uniform(-1000, 0, size=1_000)
+    yield "get_likelihood[1000 calls]", lambda: [get_likelihood(ratio) for ratio in log_pdf_ratios]
+    yield "get_likelihoods[1000]", lambda: get_likelihoods(log_pdf_ratios)
+
+
+def bench_events():
+    from classes.column import default_columns
+    from classes.event import Event, EventBatch
+    from classes.panel import month_range
+
+    # 40 years, monthly
+    timeline = month_range(date(1980, 1, 1), date(2019, 12, 1))
+    dates = timeline.astype(object)
+    column = default_columns[0]
+    yield "Column.get_data[40y monthly]", lambda: [column.get_data(day) for day in dates]
+    yield "Event[40y monthly]", lambda: [Event(day) for day in dates]
+    yield "EventBatch[40y monthly]", lambda: EventBatch(timeline).flat_data
+
+
+def bench_features():
+    text = ECONOMIC_CSV.read_text()
+    _, levels = read_levels(text)
+    yield "horizon_deltas[economic_data]", lambda: horizon_deltas(levels)
+    yield "read_levels+horizon_deltas[economic_data]", lambda: horizon_deltas(read_levels(text)[1])
+
+
+# Deterministic stand-in for the OpenAI embeddings, no network
+def stub_embedding_function(dim=1536):
+    from stub_openai import stub_embedding
+
+    return lambda input: [np.array(stub_embedding(text, dim), dtype=np.float32) for text in input]
+
+
+def bench_query_data():
+    import pandas as pd
+
+    from extract_information import query_data
+    from load_data import row_ids
+    from vector_store import NumpyCollection
+
+    events = pd.read_csv("data/events_with_economic_data.csv")
+    embed = stub_embedding_function()
+    with tempfile.TemporaryDirectory() as folder:
+        collection = NumpyCollection(folder, embedding_function=embed)
+        # the real events, repeated to get a bigger index
+        for copy in range(20):
+            collection.upsert(
+                ids=[f"{id}-{copy}" for id in row_ids(events)],
+                documents=events["description"].tolist(),
+                metadatas=events.to_dict(orient="records"),
+            )
+        query = "An oil embargo sends crude prices soaring and triggers a global recession"
+        yield f"query_data[stub collection, {collection.count()} events]", lambda: query_data(query, collection)
+
+
+SUITES = [bench_weighted_means, bench_gaussian, bench_likelihood, bench_events, bench_features, bench_query_data]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(filter=None, repeat=5, min_time=0.05):
+    results = {}
+    for suite in SUITES:
+        for name, fn in suite():
+            if filter and filter not in name:
+                continue
+            results[name] = measure(fn, repeat, min_time)
+            print(f"{name:55s} {results[name]['median_s'] * 1e6:12.1f} us")
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+# Print base vs new per benchmark, returns the names that got slower than threshold
+def compare(base, new, threshold=0.1):
+    regressions = []
+    print(f"{'benchmark':55s} {'base us':>12s} {'new us':>12s} {'change':>8s}")
+    for name, result in new["results"].items():
+        if name not in base["results"]:
+            print(f"{name:55s} {'-':>12s} {result['median_s'] * 1e6:12.1f} {'new':>8s}")
+            continue
+        before = base["results"][name]["median_s"]
+        after = result["median_s"]
+        change = after / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  slower"
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:55s} {before * 1e6:12.1f} {after * 1e6:12.1f} {change:+8.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scoring, aggregation and feature hot paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", help="write the results to this JSON file")
+    run_parser.add_argument("--filter", help="only benchmarks whose name contains this")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--min-time", type=float, default=0.05, help="seconds per round at least")
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run(args.filter, args.repeat, args.min_time)
+        if args.output:
+            with open(args.output, "w") as file:
+                json.dump(report, file, indent=2)
+    else:
+        with open(args.base) as file:
+            base = json.load(file)
+        with open(args.new) as file:
+            new = json.load(file)
+        sys.exit(1 if compare(base, new, args.threshold) else 0)
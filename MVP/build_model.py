@@ -0,0 +1,89 @@
+import io
+import os
+from pathlib import Path
+
+import numpy as np
+
+from features import FEATURES, load_features
+from scoring import GaussianScorer, OnlineGaussian, WindowedGaussians
+from utils import file_hash
+
+SOURCE_CSV = Path("data/extended_economic_data.csv")
+ARTIFACT = Path(os.getenv("MODEL_ARTIFACT", "data/model.npz"))
+
+# the 16 horizon delta columns (unemployment_rate_6m ... oil_price_24m)
+SOURCE_COLUMNS = list(range(5, 21))
+
+
+# Fit the Gaussian on the CSV and write the artifact, this is the only place
+# that needs pandas
+def build_artifact(source_csv=SOURCE_CSV, artifact=ARTIFACT):
+    import pandas as pd
+
+    data = pd.read_csv(source_csv, usecols=SOURCE_COLUMNS)
+    scorer = GaussianScorer.from_data(data)
+    scorer.save(artifact, source_hash=file_hash(source_csv), source_size=Path(source_csv).stat().st_size)
+    print(f"Wrote {artifact} ({len(data)} rows, columns {list(data.columns)})")
+    return scorer
+
+
+# New months only ever get appended to the CSV. If everything the artifact was
+# built from is still the start of the file, fold just the new rows into the
+# running statistics instead of refitting (returns None if that's not possible).
+def update_artifact(scorer, source_hash, source_size, source_csv=SOURCE_CSV, artifact=ARTIFACT):
+    if scorer.count is None or Path(source_csv).stat().st_size <= source_size:
+        return None
+    if file_hash(source_csv, source_size) != source_hash:
+        return None
+    with open(source_csv, "rb") as file:
+        file.seek(source_size - 1)
+        tail = file.read().decode("utf-8")
+    if not tail.startswith("\n"):
+        return None
+
+    rows = np.loadtxt(io.StringIO(tail), delimiter=",", usecols=SOURCE_COLUMNS, ndmin=2)
+    updated = OnlineGaussian.from_scorer(scorer).add_many(rows).publish()
+    updated.save(artifact, source_hash=file_hash(source_csv), source_size=Path(source_csv).stat().st_size)
+    print(f"Added {len(rows)} new rows of {source_csv} to {artifact}")
+    return updated
+
+
+# Load the prebuilt artifact, rebuilding it only if it's missing, from an older
+# artifact version or the CSV changed since it was built (other than by appending rows)
+def load_scorer(source_csv=SOURCE_CSV, artifact=ARTIFACT):
+    try:
+        scorer, source_hash, source_size = GaussianScorer.load(artifact)
+        if source_hash == file_hash(source_csv):
+            return scorer
+        updated = update_artifact(scorer, source_hash, source_size, source_csv, artifact)
+        if updated is not None:
+            return updated
+        print(f"{source_csv} changed, rebuilding {artifact}")
+    except (FileNotFoundError, KeyError, ValueError) as error:
+        print(f"Building {artifact}: {error}")
+    return build_artifact(source_csv, artifact)
+
+
+# Rolling / expanding window Gaussians over the same CSV. Read from the
+# features.py output if that was written with the CSV as it is now, otherwise
+# the CSV is parsed with numpy.
+def load_windows(source_csv=SOURCE_CSV, features=FEATURES):
+    try:
+        state = load_features(features)
+        if str(state["target_hash"]) == file_hash(source_csv):
+            deltas = len(state["variables"])
+            return WindowedGaussians(
+                state["dates"], state["values"][:, deltas:], columns=state["columns"][deltas:].tolist()
+            )
+    except (FileNotFoundError, KeyError, ValueError):
+        pass
+
+    with open(source_csv) as file:
+        header = file.readline().strip().split(",")
+    dates = np.loadtxt(source_csv, delimiter=",", skiprows=1, usecols=0, dtype="datetime64[D]")
+    values = np.loadtxt(source_csv, delimiter=",", skiprows=1, usecols=SOURCE_COLUMNS, ndmin=2)
+    return WindowedGaussians(dates, values, columns=[header[i] for i in SOURCE_COLUMNS])
+
+
+if __name__ == "__main__":
+    build_artifact()
@@ -1,6 +1,4 @@
-import pandas as pd
-from utils import data_folder
-from pathlib import Path
+from classes.panel import Panel
 
 date_col = "DATE"
 # no need to store each one in a variable
@@ -13,14 +11,20 @@ oil_col_name = "WTISPLC"
 data_col_names = [unemp_col_name, gdp_col_name, cpi_col_name, oil_col_name]
 
 
-
+# One series of a Panel. The data lives in the panel (all series on one monthly
+# index), so lookups for many dates are one searchsorted instead of one asof each.
 class Column:
-    def __init__(self, name) -> None:
+    def __init__(self, name, panel: Panel = None) -> None:
         self.name = name
-        self.df = pd.read_csv(data_folder / Path(f"{name}.csv"), parse_dates=[date_col], index_col=date_col)
+        self.panel = panel if panel is not None else Panel([name], date_col=date_col)
 
     def get_data(self, date):
-        timestamp = pd.Timestamp(date)
-        return self.df[self.name].asof(timestamp)
+        return self.panel.lookup_value(self.name, date)
+
+    def get_data_many(self, dates):
+        return self.panel.lookup_series(self.name, dates)
+
+
+default_panel = Panel(data_col_names, date_col=date_col)
 
-default_columns = [Column(name) for name in data_col_names]
\ No newline at end of file
+default_columns = [Column(name, default_panel) for name in data_col_names]
@@ -1,38 +1,99 @@
 from datetime import timedelta
 import numpy as np
 from classes.column import Column, date_col, default_columns
+from classes.panel import Panel
 
 
 datedeltas = [timedelta(days=day_cnt)
               for day_cnt in [0, 180, 365, 545, 730]]
 
 
+# N events stored as one (events x series x horizons) array, looked up from the
+# panel in one go. flat_data is the (events x series * (horizons - 1)) matrix of
+# growth ratios that MultiGauss takes (np.asarray(batch) gives it too).
+class EventBatch:
+    def __init__(self, dates, descriptions=None, quant_columns: list[Column] = default_columns) -> None:
+        self.dates = Panel.to_dates(dates)
+        self.descriptions = list(descriptions) if descriptions is not None else [""] * len(self.dates)
+        self.columns = quant_columns
+        self._flat_data = None
+
+        panel = quant_columns[0].panel
+        if all(column.panel is panel for column in quant_columns):
+            self.data = panel.lookup_horizons(self.dates, datedeltas, [column.name for column in quant_columns])
+        else:
+            horizon_dates = (self.dates[:, None] + np.array(datedeltas, dtype="timedelta64[D]")).ravel()
+            self.data = np.stack(
+                [column.get_data_many(horizon_dates).reshape(len(self.dates), len(datedeltas))
+                 for column in quant_columns],
+                axis=1,
+            )
+
+    @property
+    def flat_data(self):
+        # since a gdp of 10000 in 1980 is epic, while a gdp of 10000 in 2020 is meh, we want to only account
+        # for growth/decrease when putting the quant in a distribution or working with it
+        if self._flat_data is None:
+            self._flat_data = (self.data[:, :, 1:] / self.data[:, :, :-1]).reshape(len(self), -1)
+        return self._flat_data
+
+    def __array__(self, dtype=None, copy=None):
+        return self.flat_data if dtype is None else self.flat_data.astype(dtype)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return Event.view(self, index % len(self))
+
+    def __iter__(self):
+        return (Event.view(self, i) for i in range(len(self)))
+
+
+# A single event, a view into row `index` of an EventBatch
 class Event:
+    __slots__ = ("batch", "index")
+
     def __init__(self, date, description="", quant_columns: list[Column] = default_columns) -> None:
-        self.date = date
-        self.description = description
-        self.columns = quant_columns
-        self.data = {date_col: date}
-        for column in quant_columns:
-            self.data[column.name] = [column.get_data(
-                date + datedelta) for datedelta in datedeltas]
+        self.batch = EventBatch([date], [description], quant_columns)
+        self.index = 0
+
+    @classmethod
+    def view(cls, batch, index):
+        event = cls.__new__(cls)
+        event.batch = batch
+        event.index = index
+        return event
+
+    @property
+    def date(self):
+        return self.batch.dates[self.index].astype(object)
+
+    @property
+    def description(self):
+        return self.batch.descriptions[self.index]
+
+    @property
+    def columns(self):
+        return self.batch.columns
+
+    @property
+    def data(self):
+        data = {date_col: self.date}
+        for i, column in enumerate(self.columns):
+            data[column.name] = self.batch.data[self.index, i].tolist()
+        return data
 
     def get_flat_data(self):
-        # TODO you don't need the columns now, just output for everything except date
-        # DONE in next TODO organize
-        flat_data = []
-        for column in self.columns:
-            flat_data = flat_data + [self.data[column.name][i + 1] / self.data[column.name][i] for i in range(len(self.data[column.name]) - 1)]
-        return np.array(flat_data)
+        return self.batch.flat_data[self.index]
 
     @staticmethod
     def flat_data(data):
         if isinstance(data, Event):
-            data = data.data
-        flat_data = []
+            return data.get_flat_data()
         # since a gdp of 10000 in 1980 is epic, while a gdp of 10000 in 2020 is meh, we want to only account
         # for growth/decrease when putting the quant in a distribution or working with it
-        for column_name in data:
-            if column_name != date_col:
-                flat_data = flat_data + [data[column_name][i + 1] / data[column_name][i] for i in range(len(data[column_name]) - 1)]
-        return np.array(flat_data)
+        values = [np.asarray(data[column_name], dtype=float) for column_name in data if column_name != date_col]
+        return np.concatenate([column[1:] / column[:-1] for column in values])
@@ -3,9 +3,14 @@ import numpy as np
 
 
 class MultiGauss:
-    def __init__(self, data: np.ndarray) -> None:
-        mean, cov = data.mean(axis=0), data.var(axis=0)
-        self.distribution = multivariate_normal(mean, cov)
+    def __init__(self, data: np.ndarray, full_cov=False) -> None:
+        # also takes an EventBatch, which converts to its flat data matrix
+        data = np.asarray(data)
+        if full_cov:
+            mean, cov = data.mean(axis=0), np.cov(data, rowvar=False)
+        else:
+            mean, cov = data.mean(axis=0), data.var(axis=0)
+        self.distribution = multivariate_normal(mean, cov, allow_singular=full_cov)
         self.pdf_mean = self.distribution.pdf(mean)
 
     def pdf_vs_mean(self, target):
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+from utils import data_folder
+from pathlib import Path
+
+
+# All FRED series aligned on one monthly index, as one contiguous
+# (months x series) float array. A value at month m is the last observation at or
+# before m (forward filled, NaN before a series starts), so looking up any date is
+# a single searchsorted into the month index, same result as Series.asof.
+class Panel:
+    def __init__(self, names, folder=data_folder, date_col="DATE") -> None:
+        self.names = list(names)
+        series = [
+            pd.read_csv(folder / Path(f"{name}.csv"), parse_dates=[date_col], index_col=date_col)[name]
+            for name in self.names
+        ]
+        start = min(s.index.min() for s in series)
+        end = max(s.index.max() for s in series)
+        index = pd.date_range(start, end, freq="MS")
+
+        self.dates = index.values.astype("datetime64[D]")
+        self.values = np.ascontiguousarray(
+            np.column_stack(
+                [s.reindex(s.index.union(index)).ffill().reindex(index).to_numpy(dtype=np.float64) for s in series]
+            )
+        )
+        self._columns = {name: i for i, name in enumerate(self.names)}
+
+    @staticmethod
+    def to_dates(dates):
+        return pd.to_datetime(np.atleast_1d(dates)).values.astype("datetime64[D]")
+
+    # One date, without going through pandas for the usual date / datetime /
+    # "YYYY-MM-DD" inputs
+    @classmethod
+    def to_date(cls, date):
+        try:
+            return np.datetime64(date, "D")
+        except (TypeError, ValueError):
+            return cls.to_dates(date)[0]
+
+    # Values of the series (all, or the given names) at each of the dates
+    # -> (len(dates) x series)
+    def lookup(self, dates, names=None):
+        idx = np.searchsorted(self.dates, self.to_dates(dates), side="right") - 1
+        values = self.values if names is None else self.values[:, [self._columns[name] for name in names]]
+        values = values[np.maximum(idx, 0)]
+        values[idx < 0] = np.nan
+        return values
+
+    # Value of one series at a single date, a plain searchsorted on the month index
+    def lookup_value(self, name, date):
+        i = np.searchsorted(self.dates, self.to_date(date), side="right") - 1
+        return self.values[i, self._columns[name]] if i >= 0 else np.float64(np.nan)
+
+    # Values of one series at each of the dates -> (len(dates),)
+    def lookup_series(self, name, dates):
+        return self.lookup(dates, [name])[:, 0]
+
+    # Values at every date + every horizon in one lookup -> (dates x series x horizons)
+    def lookup_horizons(self, dates, horizons, names=None):
+        dates = self.to_dates(dates)
+        horizons = np.array(horizons, dtype="timedelta64[D]")
+        values = self.lookup((dates[:, None] + horizons[None, :]).ravel(), names)
+        return values.reshape(len(dates), len(horizons), -1).transpose(0, 2, 1)
+
+
+# First-of-month dates from start to end (inclusive), every step_months months
+def month_range(start, end, step_months=1):
+    return pd.date_range(start, end, freq=pd.DateOffset(months=step_months)).values.astype("datetime64[D]")
@@ -0,0 +1,72 @@
+from classes.column import default_panel
+from classes.event import datedeltas
+from utils import data_folder
+
+ECONOMIC_CSV = data_folder / "economic_data.csv"
+EVENTS_CSV = data_folder / "events_with_economic_data.csv"
+
+# Our column name -> FRED series (the CSVs in data/, DATE + one value column)
+SERIES = {
+    "unemployment_rate": "UNRATE",
+    "gdp": "GDPC1",  # quarterly, the others are monthly
+    "cpi": "CORESTICKM159SFRBATL",
+    "oil_price": "WTISPLC",
+}
+# Column suffix for each of classes.event.datedeltas (0, 180, 365, 545, 730 days)
+HORIZON_SUFFIXES = ["", "_6m", "_12m", "_18m", "_24m"]
+
+
+def event_columns():
+    return [f"{var}{suffix}" for var in SERIES for suffix in HORIZON_SUFFIXES]
+
+
+# All series on one monthly index from the first to the last month any series
+# has, each at its last observation as of that month (so quarterly GDP repeats
+# for the months in between, NaN before a series starts)
+def monthly_economic_data(panel=default_panel):
+    values = panel.lookup(panel.dates, list(SERIES.values()))
+    return panel.dates, values
+
+
+def build_economic_data(target_csv=ECONOMIC_CSV, panel=default_panel):
+    dates, values = monthly_economic_data(panel)
+    with open(target_csv, "w") as file:
+        file.write("date," + ",".join(SERIES) + "\n")
+        file.writelines(
+            f"{date},{','.join(map(repr, row))}\n"
+            for date, row in zip(dates.astype(str), values.tolist())
+        )
+    print(f"Wrote {target_csv} ({len(dates)} months)")
+
+
+# Every series at date + each datedelta for all the dates at once, one
+# searchsorted into the panel's month index -> (dates x len(event_columns())),
+# the layout of the economic columns in events_with_economic_data.csv
+def event_economic_data(dates, panel=default_panel):
+    values = panel.lookup_horizons(dates, datedeltas, list(SERIES.values()))
+    return values.reshape(len(values), -1)
+
+
+# Add (or replace) the economic columns of a DataFrame of events with a "date" column
+def attach_economic_data(events, panel=default_panel):
+    events = events.drop(columns=[column for column in event_columns() if column in events])
+    values = event_economic_data(events["date"], panel)
+    for i, column in enumerate(event_columns()):
+        events[column] = values[:, i]
+    return events
+
+
+# Re-attach the economic columns to the events in source_csv (name, description,
+# date, importance and whatever else they have) in one pass
+def build_events_with_economic_data(source_csv=EVENTS_CSV, target_csv=EVENTS_CSV, panel=default_panel):
+    import pandas as pd
+
+    events = attach_economic_data(pd.read_csv(source_csv), panel)
+    events.to_csv(target_csv, index=False, na_rep="nan")
+    print(f"Wrote {target_csv} ({len(events)} events)")
+    return events
+
+
+if __name__ == "__main__":
+    build_economic_data()
+    build_events_with_economic_data()
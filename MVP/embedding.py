@@ -1,14 +1,284 @@
 from dotenv import load_dotenv, find_dotenv
+import csv
+import hashlib
 import os
+import re
+import sqlite3
+import threading
+import zlib
+
+import numpy as np
+
+from embedding_client import BatchedEmbeddingClient
+from utils import save_npz
 
 load_dotenv()
 
-import chromadb.utils.embedding_functions.openai_embedding_function as embedding_functions
+try:
+    import chromadb.utils.embedding_functions.openai_embedding_function as embedding_functions
+    from chromadb.api.types import EmbeddingFunction
+except ImportError:
+    # chromadb is only needed for VECTOR_BACKEND=chroma, see load_data.py
+    embedding_functions = None
+    EmbeddingFunction = object
+
+# sqlite has a limit on the number of ? in one statement
+SQLITE_BATCH_SIZE = 500
+
+
+# Wraps an embedding function with a sqlite cache on disk, keyed by model name +
+# sha256 of the text. Only the texts that aren't cached yet go upstream (in one
+# call), so load_data rebuilds and repeated queries don't hit the API again.
+class CachedEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, upstream, model_name, path="embedding_cache.sqlite3") -> None:
+        self.upstream = upstream
+        self.model_name = model_name
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, hash))"
+        )
+        self._db.commit()
+
+    def text_hash(self, text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def lookup(self, hashes):
+        found = {}
+        with self._lock:
+            for start in range(0, len(hashes), SQLITE_BATCH_SIZE):
+                batch = hashes[start : start + SQLITE_BATCH_SIZE]
+                rows = self._db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? "
+                    f"AND hash IN ({', '.join('?' * len(batch))})",
+                    [self.model_name, *batch],
+                )
+                for text_hash, vector in rows:
+                    found[text_hash] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def store(self, vectors):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                [
+                    (self.model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                    for text_hash, vector in vectors.items()
+                ],
+            )
+            self._db.commit()
+
+    def __call__(self, input):
+        hashes = [self.text_hash(text) for text in input]
+        cached = self.lookup(list(set(hashes)))
+
+        # send every missing text upstream once, in a single batch
+        missing = {}
+        for text, text_hash in zip(input, hashes):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        if missing:
+            fetched = self.upstream(list(missing.values()))
+            fetched = dict(zip(missing.keys(), fetched))
+            self.store(fetched)
+            cached.update(
+                (text_hash, np.asarray(vector, dtype=np.float32))
+                for text_hash, vector in fetched.items()
+            )
+
+        # several threads embed at once (the async server's I/O pool, load_data's workers)
+        with self._lock:
+            self.upstream_calls += bool(missing)
+            self.hits += len(input) - len(missing)
+            self.misses += len(missing)
+        return [cached[text_hash] for text_hash in hashes]
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._db.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", [self.model_name]
+            ).fetchone()
+            hits, misses, upstream_calls = self.hits, self.misses, self.upstream_calls
+        lookups = hits + misses
+        return {
+            "path": self.path,
+            "model": self.model_name,
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "upstream_calls": upstream_calls,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            **({"upstream": self.upstream.stats()} if hasattr(self.upstream, "stats") else {}),
+        }
+
+
+# Same request as chroma's OpenAIEmbeddingFunction, for when chromadb isn't installed
+class OpenAIEmbeddings:
+    def __init__(self, api_key, model_name) -> None:
+        import openai
+
+        self._client = openai.OpenAI(api_key=api_key).embeddings
+        self._model_name = model_name
+
+    def __call__(self, input):
+        # replace newlines, which can negatively affect performance.
+        input = [text.replace("\n", " ") for text in input]
+        data = self._client.create(input=input, model=self._model_name).data
+        return [
+            np.array(result.embedding, dtype=np.float32)
+            for result in sorted(data, key=lambda result: result.index)
+        ]
+
+
+# Hashed n-gram TF-IDF projected onto its top singular vectors (LSA), fitted on
+# the event corpus. Embeds in-process in microseconds, no network on the query
+# path. Features are lowercase words, word bigrams and character trigrams of the
+# words, hashed with crc32, only the hashes seen in the corpus are kept.
+class LocalEmbeddingFunction(EmbeddingFunction):
+    def __init__(self, vocab, idf, projection) -> None:
+        self.vocab = {int(feature): i for i, feature in enumerate(vocab)}
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self.projection = np.asarray(projection, dtype=np.float32)
+        self.calls = 0
+        self.texts = 0
+
+    @staticmethod
+    def features(text):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(padded[i : i + 3] for i in range(len(padded) - 2))
+        return [zlib.crc32(feature.encode("utf-8")) for feature in features]
 
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    # api_base="YOUR_API_BASE_PATH",
-    # api_type="azure",
-    # api_version="YOUR_API_VERSION",
-    # model_name="text-embedding-3-small",
+    # (vocab indices, sublinear tf * idf) of a text, unknown features left out
+    def weights(self, text):
+        counts = {}
+        for feature in self.features(text):
+            i = self.vocab.get(feature)
+            if i is not None:
+                counts[i] = counts.get(i, 0) + 1
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        return indices, tf * self.idf[indices]
+
+    @classmethod
+    def fit(cls, texts, dim=256, seed=0):
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.linalg import svds
+
+        rows, columns, counts = [], [], []
+        for row, text in enumerate(texts):
+            features, feature_counts = np.unique(cls.features(text), return_counts=True)
+            rows.append(np.full(len(features), row))
+            columns.append(features)
+            counts.append(feature_counts)
+        rows, columns, counts = np.concatenate(rows), np.concatenate(columns), np.concatenate(counts)
+        vocab, columns = np.unique(columns, return_inverse=True)
+
+        df = np.bincount(columns, minlength=len(vocab))
+        idf = np.log((1 + len(texts)) / (1 + df)) + 1
+        tfidf = csr_matrix(((1 + np.log(counts)) * idf[columns], (rows, columns)), shape=(len(texts), len(vocab)))
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1))).ravel()
+        tfidf = csr_matrix(tfidf.multiply(1 / np.maximum(norms, 1e-12)[:, None]))
+
+        k = min(dim, min(tfidf.shape) - 1)
+        v0 = np.random.default_rng(seed).standard_normal(min(tfidf.shape))
+        _, singular_values, vt = svds(tfidf, k=k, v0=v0)
+        vt = vt[np.argsort(singular_values)[::-1]]
+        # make the sign of each component deterministic
+        vt *= np.sign(vt[np.arange(k), np.abs(vt).argmax(axis=1)])[:, None]
+        return cls(vocab, idf, vt.T)
+
+    def save(self, path):
+        save_npz(path, vocab=np.fromiter(self.vocab.keys(), dtype=np.uint32), idf=self.idf, projection=self.projection)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as model:
+            return cls(model["vocab"], model["idf"], model["projection"])
+
+    def __call__(self, input):
+        self.calls += 1
+        self.texts += len(input)
+        vectors = []
+        for text in input:
+            indices, weights = self.weights(text)
+            vector = weights @ self.projection[indices]
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm > 0 else vector)
+        return vectors
+
+    def stats(self):
+        return {
+            "model": "local",
+            "vocab": len(self.vocab),
+            "dim": self.projection.shape[1],
+            "calls": self.calls,
+            "texts": self.texts,
+        }
+
+
+# Texts the local model is fitted on: the curated events and the incidents in
+# World Important Dates.csv
+def event_corpus(folder="data"):
+    texts = []
+    with open(os.path.join(folder, "events_with_economic_data.csv"), newline="") as file:
+        texts.extend(f"{row['name']} {row['description']}" for row in csv.DictReader(file))
+    world_csv = os.path.join(folder, "World Important Dates.csv")
+    if os.path.exists(world_csv):
+        with open(world_csv, newline="") as file:
+            texts.extend(" ".join(list(row.values())[1:]) for row in csv.DictReader(file))
+    return texts
+
+
+# Fitted once and saved, documents and queries have to go through the same model
+def load_local_embedding(path=os.getenv("LOCAL_EMBEDDING_PATH", "data/local_embedding.npz")):
+    try:
+        return LocalEmbeddingFunction.load(path)
+    except FileNotFoundError:
+        model = LocalEmbeddingFunction.fit(event_corpus())
+        model.save(path)
+        print(f"Fitted local embedding model on the event corpus, saved to {path}")
+        return model
+
+
+openai_model_name = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
+
+# "batched" (embedding_client.py: concurrent batches, rate limits, retries,
+# OPENAI_BASE_URL to use a stub) or "chroma" (chroma's OpenAIEmbeddingFunction)
+EMBEDDING_CLIENT = os.getenv("EMBEDDING_CLIENT", "batched")
+
+if EMBEDDING_CLIENT == "batched":
+    openai_ef_uncached = BatchedEmbeddingClient(os.getenv("OPENAI_API_KEY"), openai_model_name)
+elif embedding_functions is not None:
+    openai_ef_uncached = embedding_functions.OpenAIEmbeddingFunction(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        # api_base="YOUR_API_BASE_PATH",
+        # api_type="azure",
+        # api_version="YOUR_API_VERSION",
+        model_name=openai_model_name,
+    )
+else:
+    openai_ef_uncached = OpenAIEmbeddings(os.getenv("OPENAI_API_KEY"), openai_model_name)
+
+openai_ef = CachedEmbeddingFunction(
+    openai_ef_uncached,
+    openai_model_name,
+    path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3"),
 )
+
+# "openai" or "local" (LocalEmbeddingFunction, no network at all). Each backend
+# has its own collection, see load_data.get_collection.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+
+if EMBEDDING_BACKEND == "local":
+    default_ef = load_local_embedding()
+else:
+    default_ef = openai_ef
@@ -0,0 +1,172 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
+
+# Limits of one /embeddings request (OpenAI allows 2048 inputs and 300k tokens)
+MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", 512))
+MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", 100_000))
+# Batches of one call sent at once when a big input (load_data) is split up
+CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+# Connections to the endpoint shared by all callers. One-batch calls (the query
+# embedding of a request) are sent from the caller's thread, so this, not
+# CONCURRENCY, bounds how many of those are in flight
+MAX_CONNECTIONS = int(os.getenv("EMBEDDING_MAX_CONNECTIONS", 64))
+# Account budgets, requests and tokens per minute
+RPM = float(os.getenv("EMBEDDING_RPM", 3000))
+TPM = float(os.getenv("EMBEDDING_TPM", 1_000_000))
+MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 6))
+# Backoff before retry n is random in [0, min(MAX_BACKOFF, BASE_BACKOFF * 2^n)]
+BASE_BACKOFF = float(os.getenv("EMBEDDING_BASE_BACKOFF", 0.5))
+MAX_BACKOFF = float(os.getenv("EMBEDDING_MAX_BACKOFF", 30))
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+# Rough token count without a tokenizer: ~4 characters per token for English,
+# counted a bit high so batches stay under the limits
+def estimate_tokens(text):
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+# Refills rate / 60 per second up to capacity, acquire(n) waits until n are there.
+# One for requests and one for tokens keeps us under both budgets.
+class TokenBucket:
+    def __init__(self, per_minute, capacity=None) -> None:
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # a batch bigger than the whole bucket still goes through once it's full
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+# Embedding function (list of texts -> list of float32 vectors) that talks to an
+# OpenAI compatible /embeddings endpoint directly. Inputs are split into batches
+# bounded by count and estimated tokens, several batches of one call run at once
+# (an input that fits one batch is sent from the calling thread), requests
+# wait for the RPM / TPM buckets, and 429s, 5xx and connection errors are retried
+# with jittered exponential backoff (or the server's Retry-After). base_url can
+# point at a local stub (see stub_openai.py).
+class BatchedEmbeddingClient:
+    def __init__(
+        self,
+        api_key,
+        model_name,
+        base_url=None,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_batch_tokens=MAX_BATCH_TOKENS,
+        concurrency=CONCURRENCY,
+        max_connections=MAX_CONNECTIONS,
+        rpm=RPM,
+        tpm=TPM,
+        max_retries=MAX_RETRIES,
+        timeout=60.0,
+    ) -> None:
+        self.model_name = model_name
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").rstrip("/")
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._client = httpx.Client(
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+        self._stats_lock = threading.Lock()
+        self.request_count = 0
+        self.retry_count = 0
+        self.token_count = 0
+
+    # Split into consecutive batches under max_batch_size texts / max_batch_tokens
+    def batches(self, texts):
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                yield batch, batch_tokens
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch, batch_tokens
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2**attempt))
+
+    def embed_batch(self, texts, tokens):
+        for attempt in range(self.max_retries + 1):
+            self.requests.acquire()
+            self.tokens.acquire(tokens)
+            retry_after = None
+            try:
+                response = self._client.post(
+                    f"{self.base_url}/embeddings", json={"input": texts, "model": self.model_name}
+                )
+                if response.status_code == 200:
+                    data = response.json()["data"]
+                    with self._stats_lock:
+                        self.request_count += 1
+                        self.token_count += tokens
+                    return [
+                        np.array(result["embedding"], dtype=np.float32)
+                        for result in sorted(data, key=lambda result: result["index"])
+                    ]
+                if response.status_code not in RETRY_STATUS:
+                    raise EmbeddingError(f"embedding request failed: {response.status_code} {response.text[:200]}")
+                retry_after = response.headers.get("retry-after")
+                error = EmbeddingError(f"embedding request failed: {response.status_code}")
+            except httpx.TransportError as transport_error:
+                error = transport_error
+
+            if attempt == self.max_retries:
+                raise error
+            with self._stats_lock:
+                self.retry_count += 1
+            time.sleep(self.backoff(attempt, retry_after))
+
+    def __call__(self, input):
+        # replace newlines, which can negatively affect performance.
+        texts = [text.replace("\n", " ") for text in input]
+        batches = list(self.batches(texts))
+        if len(batches) == 1:
+            return self.embed_batch(*batches[0])
+        futures = [self._pool.submit(self.embed_batch, batch, tokens) for batch, tokens in batches]
+        return [vector for future in futures for vector in future.result()]
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "requests": self.request_count,
+            "retries": self.retry_count,
+            "tokens": self.token_count,
+        }
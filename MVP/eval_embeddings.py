@@ -0,0 +1,103 @@
+# Offline comparison of the local embedding model against the OpenAI embeddings:
+# how many of the top-k events each one retrieves for the same queries agree,
+# and how long embedding a query takes.
+#   uv run eval_embeddings.py --k 10 --queries my_queries.txt
+# OpenAI corpus embeddings come from the sqlite cache where possible, set
+# OPENAI_BASE_URL to run against stub_openai.py instead of the real API.
+import argparse
+import json
+import time
+
+import numpy as np
+
+import embedding
+
+DEFAULT_QUERIES = [
+    "An oil embargo sends crude prices soaring and triggers a global recession",
+    "A pandemic forces lockdowns around the world and unemployment spikes",
+    "A major bank collapses and credit markets freeze",
+    "War breaks out between two large economies and trade routes are blocked",
+    "A tech boom drives rapid productivity growth and stock markets rally",
+    "A standoff over Taiwan disrupts the global semiconductor supply chain",
+    "Central banks raise interest rates sharply to fight high inflation",
+    "A sovereign debt crisis spreads across Europe",
+]
+
+
+def top_k(corpus_embeddings, query_embeddings, k):
+    # squared L2 on the raw vectors, same ranking as the collections use
+    distances = (
+        np.sum(corpus_embeddings**2, axis=1)[None, :]
+        - 2 * query_embeddings @ corpus_embeddings.T
+    )
+    return np.argsort(distances, axis=1)[:, :k]
+
+
+# Seconds per query embedding call, one query at a time like /process_query
+def latencies(embedding_function, queries, repeats):
+    times = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter()
+            embedding_function([query])
+            times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def summarize(times):
+    return {
+        "p50_ms": float(np.percentile(times, 50) * 1000),
+        "p95_ms": float(np.percentile(times, 95) * 1000),
+        "mean_ms": float(times.mean() * 1000),
+    }
+
+
+def evaluate(queries, k=10, repeats=3, openai_latency=True):
+    corpus = embedding.event_corpus()
+    local = embedding.load_local_embedding()
+
+    local_corpus = np.vstack(local(corpus))
+    openai_corpus = np.vstack(embedding.openai_ef(corpus))
+    local_top = top_k(local_corpus, np.vstack(local(queries)), k)
+    openai_top = top_k(openai_corpus, np.vstack(embedding.openai_ef(queries)), k)
+
+    overlaps = [len(set(a) & set(b)) / k for a, b in zip(local_top, openai_top)]
+    result = {
+        "corpus": len(corpus),
+        "queries": len(queries),
+        "k": k,
+        "overlap_at_k": float(np.mean(overlaps)),
+        "top1_agreement": float(np.mean(local_top[:, 0] == openai_top[:, 0])),
+        "per_query_overlap": dict(zip(queries, overlaps)),
+        "local_latency": summarize(latencies(local, queries, repeats)),
+    }
+    if openai_latency:
+        # the uncached client, a cache hit would only time sqlite
+        result["openai_latency"] = summarize(latencies(embedding.openai_ef_uncached, queries, 1))
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare local and OpenAI embeddings on the event corpus")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", help="file with one query per line (default: built-in scenarios)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--no-openai-latency", action="store_true", help="don't time live OpenAI calls")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as file:
+            queries = [line.strip() for line in file if line.strip()]
+
+    result = evaluate(queries, args.k, args.repeats, not args.no_openai_latency)
+    for query, overlap in result["per_query_overlap"].items():
+        print(f"{overlap:5.0%}  {query}")
+    print(f"overlap@{args.k}: {result['overlap_at_k']:.1%}, top-1 agreement: {result['top1_agreement']:.1%}")
+    for name in ("local_latency", "openai_latency"):
+        if name in result:
+            print(f"{name}: p50 {result[name]['p50_ms']:.3f} ms, p95 {result[name]['p95_ms']:.3f} ms")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(result, file, indent=2)
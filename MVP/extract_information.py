@@ -1,149 +1,105 @@
+import logging
+
 import numpy as np
 
-import chromadb
 import embedding
+from observability import timed
+
+logger = logging.getLogger(__name__)
+
+
+# Metrics and horizons stored in each event's metadata, e.g. gdp, gdp_6m, ..., gdp_24m
+METRICS = ["unemployment_rate", "gdp", "oil_price", "cpi"]
+HORIZONS = [6, 12, 18, 24]
+METRIC_FIELDS = [
+    field for metric in METRICS for field in [metric] + [f"{metric}_{h}m" for h in HORIZONS]
+]
+WEIGHTED_MEAN_KEYS = [f"weighted_mean_{metric}_{h}m" for metric in METRICS for h in HORIZONS]
+
+
+# Pack the results' metadata into a k x 20 array (missing fields are NaN) and
+# return the k x 16 horizon deltas (value at horizon - value at the event date)
+# together with the k similarity scores
+def results_to_deltas(results):
+    values = np.array(
+        [[result.get(field, np.nan) for field in METRIC_FIELDS] for result in results],
+        dtype=np.float64,
+    ).reshape(len(results), len(METRICS), len(HORIZONS) + 1)
+    deltas = (values[:, :, 1:] - values[:, :, :1]).reshape(len(results), len(WEIGHTED_MEAN_KEYS))
+    scores = np.array([result.get("score", 0) for result in results], dtype=np.float64)
+    return deltas, scores
+
+
+# Weighted mean of every delta column at once, using the similarity scores
+# normalized to percentages as weights. An event with no data for a column (NaN,
+# e.g. CPI before 1968) is left out of that column's mean, weights included, so
+# it doesn't pull it towards zero. A column no event has data for stays 0.
+def weighted_means_from_deltas(deltas, scores):
+    # Normalize similarity scores as percentages by dividing by the sum of all scores
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = scores / np.sum(scores)
+        weights = np.where(np.isnan(weights), 0, weights)
+        has_data = ~np.isnan(deltas)
+        column_weights = has_data.T @ weights
+        means = np.where(has_data, deltas, 0).T @ weights / column_weights
+        means = np.where(column_weights > 0, means, 0.0)
+    return dict(zip(WEIGHTED_MEAN_KEYS, means.tolist()))
 
 
 # Function to calculate weighted means using similarity scores as percentages
 def calculate_weighted_means(results):
-    # Initialize dictionaries to collect the values for each time-specific field
-    unemployment_rate = []
-    unemployment_rate_6m = []
-    unemployment_rate_12m = []
-    unemployment_rate_18m = []
-    unemployment_rate_24m = []
-
-    gdp = []
-    gdp_6m = []
-    gdp_12m = []
-    gdp_18m = []
-    gdp_24m = []
-
-    oil_price = []
-    oil_price_6m = []
-    oil_price_12m = []
-    oil_price_18m = []
-    oil_price_24m = []
-
-    cpi = []
-    cpi_6m = []
-    cpi_12m = []
-    cpi_18m = []
-    cpi_24m = []
-
-    similarity_scores = []
-
-    # Loop through each result and extract the values for each time-specific field
-    for result in results:
-        similarity_scores.append(result.get("score", 0))  # Collect similarity scores
-        unemployment_rate.append(result.get("unemployment_rate", np.nan))
-        unemployment_rate_6m.append(
-            result.get("unemployment_rate_6m", np.nan)
-            - result.get("unemployment_rate", np.nan)
-        )
-        unemployment_rate_12m.append(
-            result.get("unemployment_rate_12m", np.nan)
-            - result.get("unemployment_rate", np.nan)
-        )
-        unemployment_rate_18m.append(
-            result.get("unemployment_rate_18m", np.nan)
-            - result.get("unemployment_rate", np.nan)
-        )
-        unemployment_rate_24m.append(
-            result.get("unemployment_rate_24m", np.nan)
-            - result.get("unemployment_rate", np.nan)
-        )
+    return weighted_means_from_deltas(*results_to_deltas(results))
 
-        gdp.append(result.get("gdp", np.nan))
-        gdp_6m.append(result.get("gdp_6m", np.nan) - result.get("gdp", np.nan))
-        gdp_12m.append(result.get("gdp_12m", np.nan) - result.get("gdp", np.nan))
-        gdp_18m.append(result.get("gdp_18m", np.nan) - result.get("gdp", np.nan))
-        gdp_24m.append(result.get("gdp_24m", np.nan) - result.get("gdp", np.nan))
 
-        oil_price.append(result.get("oil_price", np.nan))
-        oil_price_6m.append(
-            result.get("oil_price_6m", np.nan) - result.get("oil_price", np.nan)
-        )
-        oil_price_12m.append(
-            result.get("oil_price_12m", np.nan) - result.get("oil_price", np.nan)
-        )
-        oil_price_18m.append(
-            result.get("oil_price_18m", np.nan) - result.get("oil_price", np.nan)
-        )
-        oil_price_24m.append(
-            result.get("oil_price_24m", np.nan) - result.get("oil_price", np.nan)
-        )
+# The collection's own embedding function (chroma keeps it in _embedding_function)
+def collection_embedding_function(collection):
+    return (
+        getattr(collection, "embedding_function", None)
+        or getattr(collection, "_embedding_function", None)
+        or embedding.default_ef
+    )
 
-        cpi.append(result.get("cpi", np.nan))
-        cpi_6m.append(result.get("cpi_6m", np.nan) - result.get("cpi", np.nan))
-        cpi_12m.append(result.get("cpi_12m", np.nan) - result.get("cpi", np.nan))
-        cpi_18m.append(result.get("cpi_18m", np.nan) - result.get("cpi", np.nan))
-        cpi_24m.append(result.get("cpi_24m", np.nan) - result.get("cpi", np.nan))
 
-    # Normalize similarity scores as percentages by dividing by the sum of all scores
-    total_score = np.sum(similarity_scores)
-    weights = [score / total_score for score in similarity_scores]
-
-    # Function to compute weighted mean for each field
-    def weighted_mean(values, weights):
-        values = np.array(values, dtype=np.float64)
-        weights = np.array(weights, dtype=np.float64)
-        # Use np.nansum to ignore NaN values while calculating the weighted mean
-        return np.nansum(values * weights) / np.nansum(weights)
-
-    # Calculate weighted means for each field using the normalized similarity scores as weights
-    weighted_means = {
-        # "weighted_mean_unemployment_rate": weighted_mean(unemployment_rate, weights),
-        "weighted_mean_unemployment_rate_6m": weighted_mean(
-            unemployment_rate_6m, weights
-        ),
-        "weighted_mean_unemployment_rate_12m": weighted_mean(
-            unemployment_rate_12m, weights
-        ),
-        "weighted_mean_unemployment_rate_18m": weighted_mean(
-            unemployment_rate_18m, weights
-        ),
-        "weighted_mean_unemployment_rate_24m": weighted_mean(
-            unemployment_rate_24m, weights
-        ),
-        # "weighted_mean_gdp": weighted_mean(gdp, weights),
-        "weighted_mean_gdp_6m": weighted_mean(gdp_6m, weights),
-        "weighted_mean_gdp_12m": weighted_mean(gdp_12m, weights),
-        "weighted_mean_gdp_18m": weighted_mean(gdp_18m, weights),
-        "weighted_mean_gdp_24m": weighted_mean(gdp_24m, weights),
-        # "weighted_mean_oil_price": weighted_mean(oil_price, weights),
-        "weighted_mean_oil_price_6m": weighted_mean(oil_price_6m, weights),
-        "weighted_mean_oil_price_12m": weighted_mean(oil_price_12m, weights),
-        "weighted_mean_oil_price_18m": weighted_mean(oil_price_18m, weights),
-        "weighted_mean_oil_price_24m": weighted_mean(oil_price_24m, weights),
-        # "weighted_mean_cpi": weighted_mean(cpi, weights),
-        "weighted_mean_cpi_6m": weighted_mean(cpi_6m, weights),
-        "weighted_mean_cpi_12m": weighted_mean(cpi_12m, weights),
-        "weighted_mean_cpi_18m": weighted_mean(cpi_18m, weights),
-        "weighted_mean_cpi_24m": weighted_mean(cpi_24m, weights),
-    }
-
-    return weighted_means
+# Embed the texts and run the vector query ourselves, so both stages are timed
+def embed_and_query(queries, collection):
+    with timed("embed"):
+        query_embeddings = collection_embedding_function(collection)(list(queries))
+    with timed("retrieve"):
+        return collection.query(
+            query_embeddings=[np.asarray(vector).tolist() for vector in query_embeddings]
+        )
 
 
 # Function that takes in a query and returns the vector search results with similarity scores
-def query_data(query, collection: chromadb.Collection):
+def query_data(query, collection: "chromadb.Collection"):
 
-    # data = collection.query(query_texts=[query])
-    data = collection.query(
-        # query_embeddings=embedding.openai_ef.embed_with_retries(query)
-        query_texts=[query]
-    )
+    data = embed_and_query([query], collection)
 
     if data is None:
-        print("No similar documents found.")
+        logger.warning("No similar documents found.", extra={"fields": {"query": query}})
         return
 
+    results = query_results(data, 0)
+
+    logger.debug("query results", extra={"fields": {"query": query, "results": results}})
+
+    return results
+
+
+# Several queries with one collection.query call, so their texts are embedded in
+# one batch and searched together. Returns one results list per query.
+def query_data_many(queries, collection: "chromadb.Collection"):
+    data = embed_and_query(queries, collection)
+    return [query_results(data, i) for i in range(len(queries))]
+
+
+# The results of query number i of a collection.query response, with similarity scores
+def query_results(data, i):
     results = []
 
-    ids = data["ids"][0]
-    metadatas = data["metadatas"][0]
-    distances = data["distances"][0]
+    ids = data["ids"][i]
+    metadatas = data["metadatas"][i]
+    distances = data["distances"][i]
 
     # Convert distances to similarity scores (1 / (1 + distance))
     # This ensures that smaller distances result in higher scores
@@ -159,8 +115,6 @@ def query_data(query, collection: chromadb.Collection):
         }
         results.append(result)
 
-    print(results)
-
     return results
 
 
@@ -181,23 +135,37 @@ def query_data(query, collection: chromadb.Collection):
 #     print(f"{key}: {value}")
 
 
-def get_weighted_means(query, collection: chromadb.Collection):
+def get_weighted_means(query, collection: "chromadb.Collection"):
     # Get the query results
     results = query_data(query, collection)
+    return summarize_results(results)
+
+
+# Weighted means (all results and top result only) plus the events list for a
+# query's results. This is the CPU part of get_weighted_means, query_data is the I/O.
+# events can be passed in if events_from_results was already called on results.
+def summarize_results(results, events=None):
+    with timed("aggregate"):
+        # Calculate weighted means, for all results and for the top result only,
+        # from the same packed array
+        deltas, scores = results_to_deltas(results)
+        weighted_means = weighted_means_from_deltas(deltas, scores)
+        limited_weighted_means = weighted_means_from_deltas(deltas[:1], scores[:1])
+        logger.debug(
+            "weighted means",
+            extra={"fields": {"results": len(results), "weighted_means": weighted_means}},
+        )
 
-    # Debug print to see the structure of results
-    print("First result structure:", results[0] if results else "No results")
+        if events is None:
+            events = events_from_results(results)
+    return weighted_means, events, limited_weighted_means
 
-    # Calculate weighted means
-    weighted_means = calculate_weighted_means(results)
-    limited_weighted_means = calculate_weighted_means(results[:1])
 
+# The events list of the response, most relevant first
+def events_from_results(results):
     # Get relevant events from the same results
     events = []
     for result in results:
-        # Debug print for metadata
-        print("Result metadata:", result.get("metadata", {}))
-
         events.append(
             {
                 "name": result.get(
@@ -208,8 +176,6 @@ def get_weighted_means(query, collection: chromadb.Collection):
                 "relevance": result.get("score", 0),  # The relevance score from Chroma
             }
         )
-    print("weighted_means:")
-    print(weighted_means)
 
     # Sort events by relevance score in descending order
     events.sort(key=lambda x: x["relevance"], reverse=True)
@@ -220,7 +186,7 @@ def get_weighted_means(query, collection: chromadb.Collection):
         for event in events:
             event["relevance"] = event["relevance"] / max_relevance
 
-    return weighted_means, events, limited_weighted_means
+    return events
 
 
 # TODO: Visualizing Trends Over Time: If you’re analyzing multiple query results over time, consider visualizing the results to identify trends more clearly (e.g., plot weighted_mean_unemployment_rate_6m over several queries).
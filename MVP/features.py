@@ -0,0 +1,177 @@
+import io
+import os
+from pathlib import Path
+
+import numpy as np
+
+from utils import data_folder, file_hash, save_npz
+
+# Monthly levels in, levels + horizon deltas out (what change.py used to do)
+ECONOMIC_CSV = data_folder / "economic_data.csv"
+EXTENDED_CSV = data_folder / "extended_economic_data.csv"
+# Same rows as EXTENDED_CSV in a .npz (dates, values, column names), loads
+# without any CSV parsing
+FEATURES = Path(os.getenv("FEATURES_ARTIFACT", data_folder / "features.npz"))
+
+# Events come with the levels at each horizon already, turned into deltas (what
+# changeEvents.py used to do)
+EVENTS_CSV = data_folder / "events_with_economic_data.csv"
+EXTENDED_EVENTS_CSV = data_folder / "extended_events_with_economic_data.csv"
+
+# Months ahead and variables to compute deltas for. The scoring model expects
+# the defaults (16 columns, see extract_information.WEIGHTED_MEAN_KEYS).
+HORIZONS = [int(h) for h in os.getenv("FEATURE_HORIZONS", "6,12,18,24").split(",")]
+VARIABLES = os.getenv("FEATURE_VARIABLES", "unemployment_rate,gdp,cpi,oil_price").split(",")
+
+# Bump when the layout of FEATURES changes, older files then get rebuilt
+FEATURES_VERSION = 1
+
+
+def feature_columns(variables=VARIABLES, horizons=HORIZONS):
+    return list(variables) + [f"{var}_{h}m" for var in variables for h in horizons]
+
+
+# levels is one row per month. Every row that has all its horizons inside levels
+# gets [levels, level at +h - level for each variable and horizon], the rest
+# (the last max(horizons) rows) has to wait for more months.
+def horizon_deltas(levels, horizons=HORIZONS):
+    n_rows = max(len(levels) - max(horizons), 0)
+    deltas = np.stack([levels[h : h + n_rows] - levels[:n_rows] for h in horizons], axis=2)
+    return np.concatenate([levels[:n_rows], deltas.reshape(n_rows, -1)], axis=1)
+
+
+# Dates and the variables' levels from CSV text (header line first). Rows with
+# a missing value are dropped, like the dropna() in change.py.
+def read_levels(text, variables=VARIABLES):
+    header, _, body = text.partition("\n")
+    header = header.strip().split(",")
+    usecols = [0] + [header.index(var) for var in variables]
+    fields = np.loadtxt(io.StringIO(body), delimiter=",", usecols=usecols, dtype=str, ndmin=2)
+    fields = np.where(fields == "", "nan", fields)
+    dates = fields[:, 0].astype("datetime64[D]")
+    levels = fields[:, 1:].astype(float)
+    complete = ~np.isnan(levels).any(axis=1)
+    return dates[complete], levels[complete]
+
+
+# Rows in the same format pandas' to_csv wrote them in
+def csv_lines(dates, values):
+    return "".join(
+        f"{date},{','.join(map(repr, row))}\n"
+        for date, row in zip(dates.astype(str), values.tolist())
+    )
+
+
+def save_features(state, artifact=FEATURES):
+    save_npz(artifact, version=FEATURES_VERSION, **state)
+
+
+def load_features(artifact=FEATURES):
+    with np.load(artifact) as features:
+        if int(features["version"]) != FEATURES_VERSION:
+            raise ValueError(f"{artifact} has features version {int(features['version'])}")
+        return {key: features[key] for key in features.files if key != "version"}
+
+
+# Recompute everything from the source CSV
+def build_features(source_csv=ECONOMIC_CSV, target_csv=EXTENDED_CSV, artifact=FEATURES,
+                   variables=VARIABLES, horizons=HORIZONS):
+    text = Path(source_csv).read_text()
+    dates, levels = read_levels(text, variables)
+    values = horizon_deltas(levels, horizons)
+    n_rows = len(values)
+
+    Path(target_csv).write_text(
+        "date," + ",".join(feature_columns(variables, horizons)) + "\n" + csv_lines(dates[:n_rows], values)
+    )
+    state = {
+        "dates": dates[:n_rows],
+        "values": values,
+        "columns": np.array(feature_columns(variables, horizons)),
+        "variables": np.array(variables),
+        "horizons": np.array(horizons),
+        # the rows still waiting for their horizons to come in
+        "pending_dates": dates[n_rows:],
+        "pending_levels": levels[n_rows:],
+        "source_hash": file_hash(source_csv),
+        "source_size": Path(source_csv).stat().st_size,
+        "target_hash": file_hash(target_csv),
+    }
+    save_features(state, artifact)
+    print(f"Wrote {target_csv} and {artifact} ({n_rows} rows)")
+    return state
+
+
+# Months only ever get appended to the source CSV. If the start of the file and
+# the target CSV are still what the last run saw, only the appended rows (plus
+# the pending ones before them) are computed, and the new complete rows are
+# appended to the target CSV. Falls back to build_features otherwise.
+def update_features(source_csv=ECONOMIC_CSV, target_csv=EXTENDED_CSV, artifact=FEATURES,
+                    variables=VARIABLES, horizons=HORIZONS):
+    try:
+        state = load_features(artifact)
+    except (FileNotFoundError, KeyError, ValueError) as error:
+        print(f"Building {artifact}: {error}")
+        return build_features(source_csv, target_csv, artifact, variables, horizons)
+
+    source_size = int(state["source_size"])
+    if (
+        state["variables"].tolist() != list(variables)
+        or state["horizons"].tolist() != list(horizons)
+        or not Path(target_csv).exists()
+        or file_hash(target_csv) != str(state["target_hash"])
+        or Path(source_csv).stat().st_size < source_size
+        or file_hash(source_csv, source_size) != str(state["source_hash"])
+    ):
+        print(f"{source_csv} or {target_csv} changed, rebuilding")
+        return build_features(source_csv, target_csv, artifact, variables, horizons)
+
+    with open(source_csv) as file:
+        header = file.readline()
+        file.seek(source_size - 1)
+        tail = file.read()
+    if tail == "\n" or tail == "":
+        return state
+    if not tail.startswith("\n"):
+        return build_features(source_csv, target_csv, artifact, variables, horizons)
+
+    new_dates, new_levels = read_levels(header + tail[1:], variables)
+    dates = np.concatenate([state["pending_dates"], new_dates])
+    levels = np.concatenate([state["pending_levels"], new_levels])
+    values = horizon_deltas(levels, horizons)
+    n_rows = len(values)
+
+    with open(target_csv, "a") as file:
+        file.write(csv_lines(dates[:n_rows], values))
+    state.update(
+        dates=np.concatenate([state["dates"], dates[:n_rows]]),
+        values=np.concatenate([state["values"], values]),
+        pending_dates=dates[n_rows:],
+        pending_levels=levels[n_rows:],
+        source_hash=file_hash(source_csv),
+        source_size=Path(source_csv).stat().st_size,
+        target_hash=file_hash(target_csv),
+    )
+    save_features(state, artifact)
+    print(f"Added {n_rows} new rows to {target_csv} and {artifact}")
+    return state
+
+
+# The events already have the level at every horizon, only the deltas are computed.
+# Small file with free text, so this one goes through pandas.
+def build_event_features(source_csv=EVENTS_CSV, target_csv=EXTENDED_EVENTS_CSV,
+                         variables=VARIABLES, horizons=HORIZONS):
+    import pandas as pd
+
+    data = pd.read_csv(source_csv).dropna().set_index("date")
+    for var in variables:
+        for h in horizons:
+            data[f"{var}_{h}m"] = data[f"{var}_{h}m"] - data[var]
+    data.to_csv(target_csv)
+    print(f"Wrote {target_csv} ({len(data)} events)")
+    return data
+
+
+if __name__ == "__main__":
+    update_features()
+    build_event_features()
@@ -1,27 +1,14 @@
 from utils import add_economic_data, flatten_event_data, data_folder
+from classes.panel import month_range
 from datetime import date
 import numpy as np
 from scipy.stats import multivariate_normal
 import json
 
 
-curr_date = date(1980, 1, 1)
-max_date = date(2022, 1, 1)
-
-vector_events = []
-while curr_date <= max_date:
-    vector_events.append(flatten_event_data(add_economic_data(curr_date)))
-    curr_date = date(curr_date.year + (1 if curr_date.month == 6 else 0), (curr_date.month + 6) % 12 + 1, 1)
-
-
-curr_date = date(1980, 1, 1)
-vector_events = []
-while curr_date <= date(2022, 1, 1):
-    vector_events.append(flatten_event_data(add_economic_data(curr_date)))
-    curr_date = date(curr_date.year + (1 if curr_date.month ==
-                     6 else 0), (curr_date.month + 6) % 12 + 1, 1)
-
-vector_events = np.array(vector_events)
+# every 6 months, all dates looked up in one pass
+timeline = add_economic_data(month_range(date(1980, 1, 1), date(2022, 1, 1), step_months=6))
+vector_events = np.array([flatten_event_data(event) for event in timeline])
 print(vector_events, vector_events.mean(axis=0))
 events_gaussian = multivariate_normal(vector_events.mean(axis=0),
                                       vector_events.var(axis=0),  allow_singular=True)
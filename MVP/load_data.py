@@ -1,37 +1,191 @@
-import pandas as pd
-from weaviate.classes.config import Configure, Property, DataType
-import chromadb
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
 import embedding
 
+# Max rows per collection.upsert / delete call, keeps a big CSV from turning into
+# one huge embedding request
+BATCH_SIZE = int(os.getenv("LOAD_DATA_BATCH_SIZE", 100))
+
+# Batches being embedded at the same time while loading
+EMBED_WORKERS = int(os.getenv("LOAD_DATA_EMBED_WORKERS", 4))
+
+# "chroma" (PersistentClient in ./chroma) or "numpy" (vector_store.NumpyCollection
+# in VECTOR_STORE_PATH, doesn't need chromadb at all)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "vector_store")
+
+
+# Seconds a collection version read from the store is trusted before reading it again
+VERSION_CHECK_INTERVAL = float(os.getenv("COLLECTION_VERSION_CHECK_INTERVAL", 1.0))
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+# The collection's metadata as it is in the store now. load_data.py usually runs
+# in another process than the server, and both Chroma's collection.metadata and
+# NumpyCollection keep what they read when the collection was opened.
+def stored_metadata(collection):
+    if hasattr(collection, "refresh"):
+        # NumpyCollection, re-reads the whole store if it was saved since
+        collection.refresh()
+        return collection.metadata
+    return collection._client.get_collection(collection.name).metadata
+
+
+# Version of the collection's contents, anything cached from a query (see
+# query_cache.py) is only valid for the version it was computed against. Read
+# from the store at most every VERSION_CHECK_INTERVAL seconds, so a load from
+# another process invalidates the cache within that time.
+def get_collection_version(collection):
+    now = time.monotonic()
+    with _versions_lock:
+        checked = _versions.get(id(collection))
+    if checked is not None and now - checked[0] < VERSION_CHECK_INTERVAL:
+        return checked[1]
+    version = (stored_metadata(collection) or {}).get("version", 0)
+    with _versions_lock:
+        _versions[id(collection)] = (now, version)
+    return version
+
+
+def bump_collection_version(collection):
+    metadata = {
+        key: value
+        for key, value in (stored_metadata(collection) or {}).items()
+        if not key.startswith("hnsw:")
+    }
+    metadata["version"] = metadata.get("version", 0) + 1
+    collection.modify(metadata=metadata)
+    with _versions_lock:
+        _versions[id(collection)] = (time.monotonic(), metadata["version"])
+
+
+# Stable id per event (same event keeps its id when its numbers are edited)
+def row_ids(df):
+    keys = df["name"].astype(str) + "|" + df["date"].astype(str)
+    return [hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] for key in keys]
+
+
+# Hash of everything in the row, used to tell which events changed since the last load
+def row_content_hashes(df):
+    import pandas as pd
+
+    return pd.util.hash_pandas_object(df, index=False).astype(str).tolist()
+
 
-def load_data():
+# Make the collection match df: upsert rows that are new or changed, delete rows
+# that are gone (unless delete_missing is off, for loading more events into a
+# collection that has others). Only events from the same source as df (their
+# "source" metadata, None for the curated events that have none) are deleted,
+# so syncing the curated CSV leaves e.g. load_world_events.py's events alone.
+# Everything is built column-wise and sent in batches of batch_size. Up to
+# embed_workers batches are embedded concurrently and each one is upserted as
+# soon as it's ready, so an interrupted load keeps what was upserted and the
+# next run only does the rest.
+def sync_collection(collection, df, batch_size=BATCH_SIZE, ids=None, delete_missing=True,
+                    embed_workers=EMBED_WORKERS, embedding_function=None, source=None):
+    embedding_function = embedding_function or embedding.default_ef
+    ids = row_ids(df) if ids is None else ids
+    content_hashes = row_content_hashes(df)
+
+    existing = collection.get(include=["metadatas"])
+    existing_hashes = {}
+    existing_sources = {}
+    for id, metadata in zip(existing["ids"], existing["metadatas"]):
+        existing_hashes[id] = (metadata or {}).get("content_hash")
+        existing_sources[id] = (metadata or {}).get("source")
+
+    changed = [
+        i for i, (id, content_hash) in enumerate(zip(ids, content_hashes))
+        if existing_hashes.get(id) != content_hash
+    ]
+    removed = []
+    if delete_missing:
+        removed = [id for id in existing_hashes.keys() - set(ids) if existing_sources[id] == source]
+
+    if changed:
+        changed_df = df.iloc[changed]
+        documents = changed_df["description"].astype(str).tolist()
+        metadatas = changed_df.to_dict(orient="records")  # filter on arbitrary metadata!
+        for metadata, i in zip(metadatas, changed):
+            metadata["content_hash"] = content_hashes[i]
+        changed_ids = [ids[i] for i in changed]
+
+        starts = range(0, len(changed), batch_size)
+        with ThreadPoolExecutor(max_workers=max(embed_workers, 1)) as pool:
+            embeddings = [
+                pool.submit(embedding_function, documents[start : start + batch_size])
+                for start in starts
+            ]
+            for start, batch_embeddings in zip(starts, embeddings):
+                end = start + batch_size
+                collection.upsert(
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    ids=changed_ids[start:end],
+                    embeddings=[np.asarray(vector).tolist() for vector in batch_embeddings.result()],
+                )
+                print(f"Upserted {min(end, len(changed))}/{len(changed)} events")
+
+    for start in range(0, len(removed), batch_size):
+        collection.delete(ids=removed[start : start + batch_size])
+    if removed:
+        print(f"Deleted {len(removed)} events")
+
+    if changed or removed:
+        bump_collection_version(collection)
+
+    return len(changed), len(removed)
+
+
+def get_collection(backend=VECTOR_BACKEND):
+    # embeddings of different models can't share a collection
+    suffix = "" if embedding.EMBEDDING_BACKEND == "openai" else f"_{embedding.EMBEDDING_BACKEND}"
+
+    if backend == "numpy":
+        from vector_store import NumpyCollection
+
+        return None, NumpyCollection(
+            f"{VECTOR_STORE_PATH}{suffix}", embedding_function=embedding.default_ef
+        )
+
+    import chromadb
 
     client = chromadb.PersistentClient()
 
     # client.delete_collection("events")
 
     collection = client.get_or_create_collection(
-        "events", embedding_function=embedding.openai_ef
+        f"events{suffix}", embedding_function=embedding.default_ef
     )
+    return client, collection
+
+
+# pandas is only imported here (and in row_content_hashes), so a server that
+# finds the collection already loaded never imports it
+def sync_events_csv(collection, csv_file="data/events_with_economic_data.csv", batch_size=BATCH_SIZE):
+    import pandas as pd
 
     # Load CSV data using pandas
-    csv_file = "data/events_with_economic_data.csv"  # Replace with the actual path to your CSV file
     df = pd.read_csv(csv_file)
+    return sync_collection(collection, df, batch_size=batch_size)
 
-    # Print the first few rows of the DataFrame (for debugging)
-    print(df.head())
 
-    if collection.count() == 0:
+def load_data(csv_file="data/events_with_economic_data.csv", batch_size=BATCH_SIZE):
 
-        collection.add(
-            documents=[row.description for _, row in df.iterrows()],
-            # embeddings=embedding.openai_ef.embed_with_retries(
-            #     [row.description for _, row in df.iterrows()]
-            # ),
-            metadatas=[
-                row.to_dict() for _, row in df.iterrows()
-            ],  # filter on arbitrary metadata!
-            ids=[str(id) for id in range(len(df))],  # must be unique for each doc
-        )
+    client, collection = get_collection()
+    sync_events_csv(collection, csv_file, batch_size=batch_size)
 
     return client, collection
+
+
+if __name__ == "__main__":
+    client, collection = load_data()
+    print(f"Collection has {collection.count()} events")
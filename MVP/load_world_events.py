@@ -0,0 +1,124 @@
+import argparse
+import calendar
+import re
+
+import numpy as np
+
+from economic_data import attach_economic_data
+from load_data import BATCH_SIZE, EMBED_WORKERS, get_collection, sync_collection
+from utils import data_folder
+
+WORLD_EVENTS_CSV = data_folder / "World Important Dates.csv"
+# "source" metadata of these events, load_data.py doesn't delete them
+WORLD_EVENTS_SOURCE = "world_important_dates"
+
+# The economic data starts in 1946, older events have no horizons. Later series
+# start later (UNRATE 1948, CPI 1968), events before that have NaN for them,
+# which the weighted means leave out per column.
+FIRST_ECONOMIC_YEAR = 1946
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+
+
+# "1526" -> 1526, "2600 BC" -> -2600, "Unknown" -> None
+def parse_year(text):
+    match = re.fullmatch(r"(\d+)\s*(BC)?", str(text).strip(), flags=re.IGNORECASE)
+    if match is None:
+        return None
+    return -int(match.group(1)) if match.group(2) else int(match.group(1))
+
+
+def parse_month(text):
+    return MONTHS.get(str(text).strip().lower())
+
+
+# The day column has things like "6 and 9" or "23Unknown25", take the first day
+def parse_day(text):
+    match = re.match(r"\d+", str(text).strip())
+    return int(match.group()) if match else None
+
+
+# ISO date (missing month / day as 01, like the "1970s" events use 1970-01-01) and
+# how much of it is known. BC dates and unknown years stay as the year text.
+def event_date(year, month, day):
+    if year is None:
+        return "Unknown", "unknown"
+    if year < 1:
+        return f"{-year} BC", "year"
+    if month is None:
+        return f"{year:04d}-01-01", "year"
+    if day is None or day > calendar.monthrange(year, month)[1]:
+        return f"{year:04d}-{month:02d}-01", "month"
+    return f"{year:04d}-{month:02d}-{day:02d}", "day"
+
+
+def describe(row):
+    return (
+        f"{row['Name of Incident']}: {row['Type of Event']} in {row['Place Name']}, {row['Country']}. "
+        f"Impact: {row['Impact']}. Affected: {row['Affected Population']}. "
+        f"Responsible: {row['Important Person/Group Responsible']}. Outcome: {row['Outcome']}."
+    )
+
+
+# The incidents as a DataFrame in the layout of events_with_economic_data.csv
+# (name, description, date + the economic columns) plus the CSV's other fields.
+# With enriched_only only the events that get economic data are kept.
+def world_events(csv_file=WORLD_EVENTS_CSV, enriched_only=True):
+    import pandas as pd
+
+    raw = pd.read_csv(csv_file, dtype=str, keep_default_na=False)
+    years = [parse_year(year) for year in raw["Year"]]
+    dates = [
+        event_date(year, parse_month(month), parse_day(day))
+        for year, month, day in zip(years, raw["Month"], raw["Date"])
+    ]
+
+    events = pd.DataFrame(
+        {
+            "name": raw["Name of Incident"].str.strip(),
+            "description": raw.apply(describe, axis=1),
+            "date": [date for date, _ in dates],
+            "date_precision": [precision for _, precision in dates],
+            "year": [year if year is not None else np.nan for year in years],
+            "country": raw["Country"].str.strip(),
+            "type": raw["Type of Event"].str.strip(),
+            "outcome": raw["Outcome"].str.strip(),
+            "source": WORLD_EVENTS_SOURCE,
+        }
+    )
+
+    enriched = np.array([year is not None and year >= FIRST_ECONOMIC_YEAR for year in years])
+    print(f"Parsed {len(events)} events, {enriched.sum()} from {FIRST_ECONOMIC_YEAR} on")
+    if enriched_only:
+        return attach_economic_data(events[enriched].reset_index(drop=True))
+
+    with_economic = attach_economic_data(events[enriched])
+    return pd.concat([with_economic, events[~enriched]]).sort_index().reset_index(drop=True)
+
+
+# Upsert the incidents into the event collection next to the curated events
+# (nothing is deleted). Rows that are already there unchanged are skipped, so
+# after a failure just run it again.
+def load_world_events(csv_file=WORLD_EVENTS_CSV, enriched_only=True, batch_size=BATCH_SIZE,
+                      embed_workers=EMBED_WORKERS, collection=None):
+    if collection is None:
+        _, collection = get_collection()
+    events = world_events(csv_file, enriched_only)
+    # the same incident is listed twice in a few places
+    events = events.drop_duplicates(subset=["name", "date"]).reset_index(drop=True)
+    changed, _ = sync_collection(
+        collection, events, batch_size=batch_size, delete_missing=False, embed_workers=embed_workers,
+        source=WORLD_EVENTS_SOURCE,
+    )
+    print(f"{changed} new or changed events, collection has {collection.count()} events")
+    return collection
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Load {WORLD_EVENTS_CSV} into the event collection")
+    parser.add_argument("--all", action="store_true",
+                        help=f"also load the events before {FIRST_ECONOMIC_YEAR} (no economic data)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS)
+    args = parser.parse_args()
+    load_world_events(enriched_only=not args.all, batch_size=args.batch_size, embed_workers=args.workers)
@@ -0,0 +1,320 @@
+# End to end load test: starts the backend behind uvicorn (asgi:app, or the Flask
+# app:app through uvicorn's WSGI interface with --wsgi) with stub_openai.py in
+# place of the OpenAI embeddings and a fixture NumpyCollection in place of Chroma,
+# replays scenario queries against /process_query and /calculate_pdf at a fixed
+# concurrency and reports throughput, latency percentiles and RSS per worker.
+#   uv run loadtest.py --workers 2 --concurrency 16 --requests 2000 --stub-latency 0.2
+# Every /process_query text is made unique so it pays for embedding + retrieval,
+# --cache replays the texts as they are so the query and embedding caches hit.
+import argparse
+import itertools
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from build_model import SOURCE_COLUMNS, SOURCE_CSV
+from stub_openai import start_stub
+
+MVP = Path(__file__).resolve().parent
+PERCENTILES = [50, 90, 95, 99]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Environment of the server (and of the fixture build, which has to embed with
+# the same stub and cache): everything external points into folder
+def server_env(folder, base_url, query_cache_size):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_BASE_URL": base_url,
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "loadtest",
+        "VECTOR_BACKEND": "numpy",
+        "VECTOR_STORE_PATH": str(folder / "vector_store"),
+        "EMBEDDING_CACHE_PATH": str(folder / "embedding_cache.sqlite3"),
+        "QUERY_CACHE_SIZE": str(query_cache_size),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+    })
+    return env
+
+
+# The events CSV `copies` times over (ids suffixed per copy), embedded by the stub,
+# so every worker starts from the same on-disk store instead of syncing on startup
+def build_fixture(env, events_csv, copies):
+    os.environ.update(env)
+    import pandas as pd
+
+    import load_data
+
+    events = pd.read_csv(events_csv)
+    ids = [f"{id}-{copy}" for copy in range(copies) for id in load_data.row_ids(events)]
+    _, collection = load_data.get_collection("numpy")
+    load_data.sync_collection(collection, pd.concat([events] * copies, ignore_index=True), ids=ids)
+    return collection.count()
+
+
+# Rows of the model's source data as /calculate_pdf payloads
+def economic_params(n, rng):
+    with open(SOURCE_CSV) as file:
+        header = file.readline().strip().split(",")
+    values = np.loadtxt(SOURCE_CSV, delimiter=",", skiprows=1, usecols=SOURCE_COLUMNS, ndmin=2)
+    names = [header[i] for i in SOURCE_COLUMNS]
+    return [dict(zip(names, row.tolist())) for row in values[rng.integers(len(values), size=n)]]
+
+
+# (path, json body) per request, a pdf_share of them to /calculate_pdf
+def request_plan(queries, n, pdf_share, cache, seed):
+    rng = np.random.default_rng(seed)
+    params = iter(economic_params(n, rng))
+    plan = []
+    for i in range(n):
+        if rng.random() < pdf_share:
+            plan.append(("/calculate_pdf", {"economic_params": next(params)}))
+            continue
+        query = queries[rng.integers(len(queries))]
+        plan.append(("/process_query", {"query": query if cache else f"{query} (run {seed}, request {i})"}))
+    return plan
+
+
+def start_server(env, port, workers, wsgi):
+    command = [
+        sys.executable, "-m", "uvicorn", "app:app" if wsgi else "asgi:app",
+        "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    if wsgi:
+        command += ["--interface", "wsgi"]
+    return subprocess.Popen(command, cwd=MVP, env=env)
+
+
+def wait_until_ready(server, url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode}")
+        try:
+            if httpx.get(f"{url}/health", timeout=5).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server not ready after {timeout}s")
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+# The uvicorn workers: children of the server process, or the server itself when
+# it runs a single worker. Linux only (reads /proc).
+def worker_pids(pid):
+    children = []
+    for entry in Path("/proc").glob("[0-9]*"):
+        try:
+            stat = (entry / "stat").read_text()
+            cmdline = (entry / "cmdline").read_bytes()
+        except OSError:
+            continue
+        # the process name in (...) may contain spaces, the parent pid follows it
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid and b"resource_tracker" not in cmdline:
+            children.append(int(entry.name))
+    return sorted(children) or [pid]
+
+
+# Samples the workers' RSS in the background, keeping the first, peak and last
+class MemorySampler(threading.Thread):
+    def __init__(self, pid, interval=0.5) -> None:
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = {}
+        self.stopped = threading.Event()
+
+    def sample(self):
+        for pid in worker_pids(self.pid):
+            rss = rss_mb(pid)
+            if rss is None:
+                continue
+            first, peak, _ = self.samples.get(pid, (rss, rss, rss))
+            self.samples[pid] = (first, max(peak, rss), rss)
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+        return {
+            str(pid): {"start_mb": first, "peak_mb": peak, "end_mb": last}
+            for pid, (first, peak, last) in sorted(self.samples.items())
+        }
+
+
+# Sends the plan with `concurrency` requests in flight, returns (path, status,
+# seconds) per request and the wall time
+def replay(url, plan, concurrency, timeout):
+    results = [None] * len(plan)
+    counter = itertools.count()
+    lock = threading.Lock()
+
+    def send(client):
+        while True:
+            with lock:
+                i = next(counter)
+            if i >= len(plan):
+                return
+            path, body = plan[i]
+            start = time.perf_counter()
+            try:
+                status = client.post(f"{url}{path}", json=body).status_code
+            except httpx.TransportError as error:
+                status = type(error).__name__
+            results[i] = (path, status, time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    with httpx.Client(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        threads = [threading.Thread(target=send, args=(client,)) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+    return results, wall
+
+
+def summarize(results, wall):
+    summary = {}
+    for path in sorted({path for path, _, _ in results}) + ["all"]:
+        selected = [(status, seconds) for p, status, seconds in results if path in (p, "all")]
+        times = np.array([seconds for _, seconds in selected]) * 1000
+        summary[path] = {
+            "requests": len(selected),
+            "errors": sum(status != 200 for status, _ in selected),
+            "throughput_rps": len(selected) / wall,
+            **{f"p{p}_ms": float(v) for p, v in zip(PERCENTILES, np.percentile(times, PERCENTILES))},
+            "max_ms": float(times.max()),
+        }
+    return summary
+
+
+def print_report(report):
+    print(
+        f"\n{report['server']}, {report['workers']} worker(s), concurrency {report['concurrency']}, "
+        f"stub latency {report['stub_latency']}s, {report['fixture_events']} events, {report['wall_s']:.1f}s"
+    )
+    print(f"{'endpoint':16s} {'requests':>8s} {'errors':>6s} {'req/s':>8s} "
+          + " ".join(f"{f'p{p} ms':>9s}" for p in PERCENTILES) + f" {'max ms':>9s}")
+    for path, row in report["latency"].items():
+        print(f"{path:16s} {row['requests']:8d} {row['errors']:6d} {row['throughput_rps']:8.1f} "
+              + " ".join(f"{row[f'p{p}_ms']:9.1f}" for p in PERCENTILES) + f" {row['max_ms']:9.1f}")
+    print(f"{'worker pid':16s} {'start MB':>9s} {'peak MB':>9s} {'end MB':>9s}")
+    for pid, row in report["memory"].items():
+        print(f"{pid:16s} {row['start_mb']:9.1f} {row['peak_mb']:9.1f} {row['end_mb']:9.1f}")
+    print(f"stub: {report['stub']}")
+
+
+def load_test(args):
+    folder = Path(args.fixture_dir) if args.fixture_dir else Path(tempfile.mkdtemp(prefix="loadtest_"))
+    folder.mkdir(parents=True, exist_ok=True)
+    stub, base_url = start_stub(latency=args.stub_latency, error_rate=args.stub_error_rate)
+    env = server_env(folder, base_url, args.query_cache_size)
+    fixture_events = build_fixture(env, args.events_csv, args.fixture_copies)
+
+    # imports embedding, so only after build_fixture pointed it at the stub
+    from eval_embeddings import DEFAULT_QUERIES
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as file:
+            queries = [line.strip() for line in file if line.strip()]
+    warmup = request_plan(queries, args.warmup, args.pdf_share, args.cache, seed=args.seed + 1)
+    plan = request_plan(queries, args.requests, args.pdf_share, args.cache, seed=args.seed)
+
+    port = args.port or free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = start_server(env, port, args.workers, args.wsgi)
+    try:
+        wait_until_ready(server, url, args.startup_timeout)
+        replay(url, warmup, args.concurrency, args.timeout)
+        stub_before = stub.stats()
+        sampler = MemorySampler(server.pid)
+        sampler.start()
+        results, wall = replay(url, plan, args.concurrency, args.timeout)
+        memory = sampler.stop()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        stub.shutdown()
+        if not args.fixture_dir:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    return {
+        "server": "uvicorn app:app (wsgi)" if args.wsgi else "uvicorn asgi:app",
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "stub_latency": args.stub_latency,
+        "fixture_events": fixture_events,
+        "cache": args.cache,
+        "wall_s": wall,
+        "latency": summarize(results, wall),
+        "memory": memory,
+        "stub": {key: stub.stats()[key] - stub_before[key] for key in stub_before},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the backend with a stub OpenAI and a fixture store")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--wsgi", action="store_true", help="serve the Flask app instead of asgi.py")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    parser.add_argument("--pdf-share", type=float, default=0.5, help="share of requests to /calculate_pdf")
+    parser.add_argument("--queries", help="file with one scenario per line (default: built-in scenarios)")
+    parser.add_argument("--cache", action="store_true", help="replay texts verbatim so the caches hit")
+    parser.add_argument("--query-cache-size", type=int, default=256, help="QUERY_CACHE_SIZE of the server")
+    parser.add_argument("--stub-latency", type=float, default=0.1, help="seconds per embeddings request")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="share of embeddings requests that get a 429")
+    parser.add_argument("--events-csv", default="data/events_with_economic_data.csv")
+    parser.add_argument("--fixture-copies", type=int, default=20, help="times the events go into the fixture store")
+    parser.add_argument("--fixture-dir", help="keep the fixture store and embedding cache here (default: temporary)")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds per request")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = load_test(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
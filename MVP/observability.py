@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Stages of a scenario request, each one timed separately
+STAGES = ["embed", "retrieve", "aggregate", "score", "serialize"]
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+# p50 / p95 / p99 are over the last this many observations of a stage
+QUANTILE_WINDOW = int(os.getenv("METRICS_QUANTILE_WINDOW", 2048))
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+# key=value pairs passed as extra={"fields": {...}} end up in the log line, as
+# JSON keys with LOG_FORMAT=json or appended as key=value otherwise
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, json_lines=False) -> None:
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+        self.json_lines = json_lines
+
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        if self.json_lines:
+            entry = {
+                "time": self.formatTime(record),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields,
+            }
+            return json.dumps(entry, default=str)
+        line = super().format(record)
+        return " ".join([line] + [f"{key}={json.dumps(value, default=str)}" for key, value in fields.items()])
+
+
+# LOG_LEVEL (default INFO, DEBUG brings back the per request dumps of results and
+# weighted means) and LOG_FORMAT=json for one JSON object per line
+def configure_logging():
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(json_lines=os.getenv("LOG_FORMAT") == "json"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = np.zeros(len(BUCKETS) + 1, dtype=np.int64)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=QUANTILE_WINDOW)
+
+    def observe(self, seconds):
+        self.counts[np.searchsorted(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+
+# Request counters and per stage latency histograms, rendered in the Prometheus
+# text format by render()
+class Metrics:
+    def __init__(self) -> None:
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    def count_request(self, route, status):
+        with self._lock:
+            key = (route, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    # gauges is {prefix: stats dict}, e.g. {"query_cache": query_cache.stats()},
+    # every number in it is exported as prefix_key
+    def render(self, gauges=None):
+        lines = [
+            "# HELP http_requests_total Requests by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for (route, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{route="{route}",status="{status}"}} {count}')
+
+            lines += [
+                "# HELP stage_duration_seconds Time spent in each stage of a scenario request.",
+                "# TYPE stage_duration_seconds histogram",
+            ]
+            for stage, histogram in self.stages.items():
+                cumulative = np.cumsum(histogram.counts)
+                for bound, count in zip(BUCKETS + ["+Inf"], cumulative):
+                    lines.append(f'stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines += [
+                f"# HELP stage_duration_seconds_recent Quantiles of the last {QUANTILE_WINDOW} observations per stage.",
+                "# TYPE stage_duration_seconds_recent gauge",
+            ]
+            for stage, histogram in self.stages.items():
+                if not histogram.recent:
+                    continue
+                values = np.percentile(np.array(histogram.recent), [q * 100 for q in QUANTILES])
+                for q, value in zip(QUANTILES, values):
+                    lines.append(f'stage_duration_seconds_recent{{stage="{stage}",quantile="{q}"}} {value}')
+
+        for prefix, stats in (gauges or {}).items():
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+timed = metrics.timed
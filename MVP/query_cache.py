@@ -0,0 +1,83 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+# Bounded LRU cache with a TTL for process_query results, so scenario texts that
+# come in again don't pay for another embedding call and Chroma query.
+# Entries are tied to a collection version: when load_data changes the
+# collection the version moves on and everything cached before is dropped.
+class QueryCache:
+    def __init__(self, max_size=256, ttl=3600.0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query):
+        # collapse whitespace, so re-submitted texts with different line breaks still hit
+        return " ".join(str(query).split())
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, query, version):
+        key = self.normalize(query)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        # callers are free to modify what they get back
+        return copy.deepcopy(value)
+
+    def set(self, query, version, value):
+        if self.max_size <= 0:
+            return
+        key = self.normalize(query)
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, query, version, compute):
+        value = self.get(query, version)
+        if value is None:
+            value = compute()
+            self.set(query, version, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,341 @@
+import threading
+from collections import deque
+
+import numpy as np
+from scipy.linalg import LinAlgError, cho_factor, cho_solve, solve_triangular
+
+from utils import save_npz
+
+# Bump when the layout of the saved .npz changes, old artifacts then get rebuilt
+ARTIFACT_VERSION = 2
+
+# Conditional factors kept per scorer, the masks come from the requests
+MAX_CONDITIONALS = 256
+
+
+# the bigger this magnitude number the more unlikely it is
+# takes log(pdf / pdf(mean)) so extreme scenarios don't underflow to 0
+def get_likelihood(log_pdf_ratio):
+    # Handle edge cases
+    if not np.isfinite(log_pdf_ratio) or log_pdf_ratio > np.log(1e308):
+        return "Extremely Unlikely"
+
+    magnitude = -int(np.floor(log_pdf_ratio / np.log(10)))
+
+    # Define categories based on magnitude
+    if magnitude >= 200:
+        return "Extremely Unlikely"
+    elif magnitude >= 50:
+        return "Very Unlikely"
+    elif magnitude >= 20:
+        return "Unlikely"
+    elif magnitude >= 10:
+        return "Neutral"
+    else:
+        return "Likely"
+
+
+# vectorized get_likelihood, same buckets for a whole array of log pdf ratios
+def get_likelihoods(log_pdf_ratios):
+    log_pdf_ratios = np.asarray(log_pdf_ratios, dtype=float)
+    magnitude = -np.floor(log_pdf_ratios / np.log(10))
+
+    likelihoods = np.select(
+        [magnitude >= 200, magnitude >= 50, magnitude >= 20, magnitude >= 10],
+        ["Extremely Unlikely", "Very Unlikely", "Unlikely", "Neutral"],
+        default="Likely",
+    )
+    # Handle edge cases
+    invalid = ~np.isfinite(log_pdf_ratios) | (log_pdf_ratios > np.log(1e308))
+    likelihoods[invalid] = "Extremely Unlikely"
+    return likelihoods.tolist()
+
+
+# Multivariate normal that only ever answers "how likely is x compared to the mean".
+# The covariance is factored once up front, so scoring is a single matrix product
+# and stays in log space (pdf / pdf(mean) underflows to 0 for extreme scenarios).
+class GaussianScorer:
+    def __init__(self, mean, cov, columns=None, count=None) -> None:
+        self.mean = np.asarray(mean, dtype=float)
+        self.cov = np.asarray(cov, dtype=float)
+        self.columns = list(columns) if columns is not None else None
+        # number of observations mean and cov were estimated from, if known
+        self.count = count
+        self._conditionals = {}
+
+        try:
+            chol = np.linalg.cholesky(self.cov)
+            # whiten = L^-1, so |whiten @ (x - mean)|^2 is the squared Mahalanobis distance
+            self.whiten = solve_triangular(chol, np.eye(len(self.mean)), lower=True)
+            self.rank = len(self.mean)
+            log_det = 2 * np.sum(np.log(np.diag(chol)))
+        except np.linalg.LinAlgError:
+            # singular covariance, same as multivariate_normal(allow_singular=True):
+            # use the pseudo-inverse on the non-degenerate eigenvectors
+            eigvals, eigvecs = np.linalg.eigh(self.cov)
+            keep = eigvals > eigvals.max() * len(eigvals) * np.finfo(float).eps
+            self.whiten = (eigvecs[:, keep] / np.sqrt(eigvals[keep])).T
+            self.rank = int(keep.sum())
+            log_det = np.sum(np.log(eigvals[keep]))
+
+        # log pdf at the mean, i.e. the log of the old mean_pdf
+        self.log_pdf_mean = -0.5 * (self.rank * np.log(2 * np.pi) + log_det)
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data.mean().values, data.cov().values, columns=data.columns, count=len(data))
+
+    # Save everything needed for scoring to a small .npz, so a server can start
+    # without reading the CSV or factoring the covariance again
+    def save(self, path, source_hash="", source_size=0):
+        save_npz(
+            path,
+            version=ARTIFACT_VERSION,
+            source_hash=source_hash,
+            source_size=source_size,
+            count=self.count if self.count is not None else -1,
+            mean=self.mean,
+            cov=self.cov,
+            whiten=self.whiten,
+            rank=self.rank,
+            log_pdf_mean=self.log_pdf_mean,
+            columns=np.array(self.columns if self.columns is not None else [], dtype=str),
+        )
+
+    # Returns the scorer and the source_hash and source_size it was saved with
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as artifact:
+            if int(artifact["version"]) != ARTIFACT_VERSION:
+                raise ValueError(f"{path} has artifact version {int(artifact['version'])}")
+            scorer = cls.__new__(cls)
+            scorer.mean = artifact["mean"]
+            scorer.cov = artifact["cov"]
+            scorer.whiten = artifact["whiten"]
+            scorer.rank = int(artifact["rank"])
+            scorer.log_pdf_mean = float(artifact["log_pdf_mean"])
+            scorer.columns = artifact["columns"].tolist() or None
+            scorer.count = int(artifact["count"]) if int(artifact["count"]) >= 0 else None
+            scorer._conditionals = {}
+            return scorer, str(artifact["source_hash"]), int(artifact["source_size"])
+
+    def mahalanobis_sq(self, x):
+        z = (np.asarray(x, dtype=float) - self.mean) @ self.whiten.T
+        return np.sum(z * z, axis=-1)
+
+    # log(pdf(x) / pdf(mean)), works on a single vector or an N x d matrix
+    def log_pdf_ratio(self, x):
+        return -0.5 * self.mahalanobis_sq(x)
+
+    def log_pdf(self, x):
+        return self.log_pdf_mean + self.log_pdf_ratio(x)
+
+    def pdf(self, x):
+        return np.exp(self.log_pdf(x))
+
+    # Gain matrix and covariance of the missing coordinates given the observed
+    # ones (Schur complement), cached per observed mask: after the first query
+    # with a mask, conditioning is a matrix-vector product
+    def conditional_factors(self, mask):
+        factors = self._conditionals.get(mask)
+        if factors is not None:
+            return factors
+
+        observed = np.flatnonzero(mask)
+        missing = np.flatnonzero(~np.array(mask))
+        cov_oo = self.cov[np.ix_(observed, observed)]
+        cov_mo = self.cov[np.ix_(missing, observed)]
+        try:
+            gain = cho_solve(cho_factor(cov_oo), cov_mo.T).T
+        except LinAlgError:
+            gain = cov_mo @ np.linalg.pinv(cov_oo)
+        cond_cov = self.cov[np.ix_(missing, missing)] - gain @ cov_mo.T
+
+        factors = (observed, missing, gain, cond_cov)
+        # clients pick the mask, so don't let them grow this without bound
+        if len(self._conditionals) >= MAX_CONDITIONALS:
+            self._conditionals.clear()
+        self._conditionals[mask] = factors
+        return factors
+
+    # Conditional distribution of the columns not in params given the ones that are
+    # (params keyed like vector() takes them). Returns the missing column names,
+    # their conditional mean and covariance.
+    def conditional(self, params: dict):
+        by_column = {key.removeprefix("weighted_mean_"): value for key, value in params.items()}
+        unknown = sorted(set(by_column) - set(self.columns))
+        if unknown:
+            raise ValueError(f"unknown economic params {unknown}")
+        values = np.array([float(value) for value in by_column.values()])
+        if not np.all(np.isfinite(values)):
+            raise ValueError("economic params must be finite numbers")
+
+        mask = tuple(column in by_column for column in self.columns)
+        observed, missing, gain, cond_cov = self.conditional_factors(mask)
+        x_observed = np.array([by_column[self.columns[i]] for i in observed], dtype=float)
+        mean = self.mean[missing] + gain @ (x_observed - self.mean[observed])
+        return [self.columns[i] for i in missing], mean, cond_cov
+
+    # Order a dict of params like {"weighted_mean_gdp_6m": ...} by self.columns.
+    # Falls back to the dict's own order if the keys don't name the columns, with
+    # strict a ValueError naming the missing / unknown keys instead.
+    def vector(self, params: dict, strict=False):
+        if self.columns is not None:
+            by_column = {key.removeprefix("weighted_mean_"): value for key, value in params.items()}
+            missing = [column for column in self.columns if column not in by_column]
+            unknown = sorted(set(by_column) - set(self.columns)) if strict else []
+            if not missing and not unknown:
+                return np.array([by_column[column] for column in self.columns], dtype=float)
+            if strict:
+                raise ValueError(f"economic params don't match the columns: missing {missing}, unknown {unknown}")
+        return np.array(list(params.values()), dtype=float)
+
+
+# Running mean / covariance (Welford, co-moment matrix) so new observations can
+# be added, or old ones removed, in O(d^2) each instead of refitting on the whole
+# dataset. With window=n only the last n observations are kept (the oldest is
+# removed when a new one comes in). publish() builds a GaussianScorer from the
+# current statistics and swaps it into self.scorer in one assignment, so readers
+# always see either the old or the new scorer.
+class OnlineGaussian:
+    def __init__(self, dim, columns=None, window=None, diagonal=False) -> None:
+        self.dim = dim
+        self.columns = list(columns) if columns is not None else None
+        self.window = window
+        # only the variances, like MultiGauss, instead of the full covariance
+        self.diagonal = diagonal
+        self.count = 0
+        self.mean = np.zeros(dim)
+        self.m2 = np.zeros((dim, dim))
+        self.scorer = None
+        self._observations = deque() if window is not None else None
+        self._lock = threading.Lock()
+
+    # Continue from a fitted scorer (e.g. the build_model.py artifact), needs its count
+    @classmethod
+    def from_scorer(cls, scorer, diagonal=False):
+        if scorer.count is None:
+            raise ValueError("scorer has no observation count to continue from")
+        online = cls(len(scorer.mean), columns=scorer.columns, diagonal=diagonal)
+        online.count = scorer.count
+        online.mean = scorer.mean.copy()
+        online.m2 = scorer.cov * (scorer.count - 1)
+        online.scorer = scorer
+        return online
+
+    def _add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += np.outer(delta, x - self.mean)
+
+    def _remove(self, x):
+        if self.count <= 1:
+            self.count = 0
+            self.mean = np.zeros(self.dim)
+            self.m2 = np.zeros((self.dim, self.dim))
+            return
+        old_mean = self.mean
+        self.count -= 1
+        self.mean = (old_mean * (self.count + 1) - x) / self.count
+        self.m2 -= np.outer(x - self.mean, x - old_mean)
+
+    def add(self, x):
+        self.add_many(np.asarray(x, dtype=float)[None, :])
+        return self
+
+    def add_many(self, rows):
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.dim)
+        with self._lock:
+            if self._observations is not None:
+                for x in rows:
+                    self._add(x)
+                    self._observations.append(x)
+                    if len(self._observations) > self.window:
+                        self._remove(self._observations.popleft())
+            elif len(rows):
+                # merge the batch's own mean / co-moments in one step (Chan et al.)
+                batch_mean = rows.mean(axis=0)
+                centered = rows - batch_mean
+                delta = batch_mean - self.mean
+                count = self.count + len(rows)
+                self.m2 += centered.T @ centered + np.outer(delta, delta) * self.count * len(rows) / count
+                self.mean = self.mean + delta * len(rows) / count
+                self.count = count
+        return self
+
+    def remove(self, x):
+        with self._lock:
+            self._remove(np.asarray(x, dtype=float))
+        return self
+
+    @property
+    def cov(self):
+        # same ddof=1 as DataFrame.cov
+        return self.m2 / (self.count - 1) if self.count > 1 else np.full((self.dim, self.dim), np.nan)
+
+    def publish(self):
+        with self._lock:
+            mean, cov, count = self.mean.copy(), self.cov, self.count
+        if self.diagonal:
+            cov = np.diag(np.diag(cov))
+        scorer = GaussianScorer(mean, cov, columns=self.columns, count=count)
+        self.scorer = scorer
+        return scorer
+
+
+# A family of Gaussians over date windows of the same data (e.g. the trailing 10
+# years as of some date), for scoring against the regime of that period instead
+# of the whole history. Prefix sums of the (centered) rows and their outer products
+# give any window's mean and covariance in O(d^2), independent of the window length,
+# and the scorers are cached per window.
+class WindowedGaussians:
+    def __init__(self, dates, values, columns=None, max_cached=256) -> None:
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        values = np.asarray(values, dtype=float)
+        self.columns = list(columns) if columns is not None else None
+        self.max_cached = max_cached
+
+        # centering first keeps the differences of big prefix sums accurate
+        self.center = values.mean(axis=0)
+        centered = values - self.center
+        dim = values.shape[1]
+        self.sums = np.concatenate([np.zeros((1, dim)), np.cumsum(centered, axis=0)])
+        self.outer_sums = np.concatenate(
+            [np.zeros((1, dim, dim)), np.cumsum(centered[:, :, None] * centered[:, None, :], axis=0)]
+        )
+        self._scorers = {}
+        self._lock = threading.Lock()
+
+    # Scorer for rows start:end
+    def by_index(self, start, end):
+        key = (start, end)
+        scorer = self._scorers.get(key)
+        if scorer is not None:
+            return scorer
+
+        count = end - start
+        if count <= len(self.center):
+            raise ValueError(f"window has {count} observations, need more than {len(self.center)}")
+        mean = (self.sums[end] - self.sums[start]) / count
+        cov = (self.outer_sums[end] - self.outer_sums[start] - count * np.outer(mean, mean)) / (count - 1)
+        scorer = GaussianScorer(mean + self.center, cov, columns=self.columns, count=count)
+
+        with self._lock:
+            if len(self._scorers) >= self.max_cached:
+                self._scorers.clear()
+            self._scorers[key] = scorer
+        return scorer
+
+    # Scorer for the rows dated in (as_of - window_years, as_of], or all rows up to
+    # as_of (expanding window) if window_years is None
+    def as_of(self, as_of, window_years=None):
+        as_of = np.datetime64(as_of, "D")
+        end = int(np.searchsorted(self.dates, as_of, side="right"))
+        start = 0
+        if window_years is not None:
+            month = as_of.astype("datetime64[M]")
+            day_offset = as_of - month.astype("datetime64[D]")
+            window_start = (month - int(round(window_years * 12))).astype("datetime64[D]") + day_offset
+            start = int(np.searchsorted(self.dates, window_start, side="right"))
+        return self.by_index(start, end)
@@ -0,0 +1,113 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Paths generated at once, bounds memory to CHUNK_SIZE x 16 floats per chunk
+CHUNK_SIZE = int(os.getenv("SIMULATION_CHUNK_SIZE", 100_000))
+# Histogram bins per column that the quantiles are read from
+BINS = int(os.getenv("SIMULATION_BINS", 4096))
+# Worker processes for big runs, 0 simulates in the calling process
+PROCESSES = int(os.getenv("SIMULATION_PROCESSES", 0))
+# Smaller runs stay in process even with PROCESSES set, starting workers costs more
+PROCESS_MIN_PATHS = int(os.getenv("SIMULATION_PROCESS_MIN_PATHS", 2_000_000))
+# The histograms span the centers +- this many standard deviations, anything
+# further out is counted in the edge bins
+RANGE_SDS = 8.0
+
+
+# L with L @ L.T == cov, so L @ z is a draw from N(0, cov) for standard normal z
+def sampling_factor(cov):
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        # singular covariance, sample on the non-degenerate eigenvectors only
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        return eigvecs * np.sqrt(np.clip(eigvals, 0, None))
+
+
+# One chunk of paths, reduced to per-column histogram counts, exceedance counts
+# and sums right away so the paths themselves are never kept
+def simulate_chunk(factor, centers, weights, lo, width, thresholds, n_paths, seed):
+    rng = np.random.default_rng(seed)
+    dim = len(factor)
+    paths = rng.standard_normal((n_paths, dim)) @ factor.T
+    if len(centers) == 1:
+        paths += centers[0]
+    else:
+        # mixture: every path is centered on one analog, picked by weight
+        paths += centers[rng.choice(len(centers), size=n_paths, p=weights)]
+
+    bins = np.clip(((paths - lo) / width).astype(np.int64), 0, BINS - 1)
+    # offset each column's bins so one bincount histograms all columns
+    bins += np.arange(dim) * BINS
+    counts = np.bincount(bins.ravel(), minlength=dim * BINS).reshape(dim, BINS)
+
+    with np.errstate(invalid="ignore"):
+        exceeded = np.sum(paths > thresholds, axis=0)
+    return counts, exceeded, paths.sum(axis=0), np.sum(paths * paths, axis=0)
+
+
+# Monte Carlo over the scorer's Gaussian: n_paths draws of N(center, cov), where
+# center is the scorer's mean, one given vector, or (mixture) one of the rows of
+# centers picked with probability proportional to weights. thresholds is a
+# vector with a value per column (NaN for none), exceedance is P(x > threshold).
+#
+# Every chunk gets its own seed spawned from seed, so results only depend on
+# seed, n_paths and chunk_size, not on how many processes ran the chunks.
+def simulate(
+    scorer,
+    n_paths,
+    centers=None,
+    weights=None,
+    thresholds=None,
+    quantiles=(0.01, 0.05, 0.5, 0.95, 0.99),
+    seed=0,
+    chunk_size=CHUNK_SIZE,
+    processes=None,
+):
+    dim = len(scorer.mean)
+    centers = np.asarray(scorer.mean if centers is None else centers, dtype=float).reshape(-1, dim)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+        weights = weights / weights.sum()
+    thresholds = np.full(dim, np.nan) if thresholds is None else np.asarray(thresholds, dtype=float)
+    processes = PROCESSES if processes is None else processes
+
+    factor = sampling_factor(scorer.cov)
+    sd = np.sqrt(np.clip(np.diag(scorer.cov), 0, None))
+    lo = centers.min(axis=0) - RANGE_SDS * sd
+    hi = centers.max(axis=0) + RANGE_SDS * sd
+    width = np.where(hi > lo, (hi - lo) / BINS, 1.0)
+
+    sizes = [chunk_size] * (n_paths // chunk_size)
+    if n_paths % chunk_size:
+        sizes.append(n_paths % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(factor, centers, weights, lo, width, thresholds, size, chunk_seed)
+            for size, chunk_seed in zip(sizes, seeds)]
+
+    if processes > 1 and n_paths >= PROCESS_MIN_PATHS:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            chunks = list(pool.map(simulate_chunk, *zip(*args)))
+    else:
+        chunks = [simulate_chunk(*chunk_args) for chunk_args in args]
+
+    counts = sum(chunk[0] for chunk in chunks)
+    exceeded = sum(chunk[1] for chunk in chunks)
+    mean = sum(chunk[2] for chunk in chunks) / n_paths
+    std = np.sqrt(np.maximum(sum(chunk[3] for chunk in chunks) / n_paths - mean * mean, 0))
+
+    # quantiles by linear interpolation in each column's cumulative histogram
+    cdf = np.concatenate([np.zeros((dim, 1)), np.cumsum(counts, axis=1) / n_paths], axis=1)
+    edges = lo[:, None] + width[:, None] * np.arange(BINS + 1)
+    quantile_values = np.array(
+        [[np.interp(q, cdf[i], edges[i]) for i in range(dim)] for q in quantiles]
+    ).reshape(len(quantiles), dim)
+
+    return {
+        "mean": mean,
+        "std": std,
+        "quantiles": quantile_values,
+        "exceedance": np.where(np.isnan(thresholds), np.nan, exceeded / n_paths),
+    }
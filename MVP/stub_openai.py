@@ -0,0 +1,118 @@
+# Local stand-in for OpenAI's /v1/embeddings, for testing the embedding client
+# and load testing without an API key:
+#   python stub_openai.py --port 8001 --latency 0.2 --error-rate 0.1
+#   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python load_data.py
+# Vectors are a deterministic function of the text, so the same text always
+# gets the same embedding. --error-rate answers that share of requests with a
+# 429, --rpm with a 429 once more requests than that came in the last minute.
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def stub_embedding(text, dim):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dim=1536, latency=0.0, error_rate=0.0, rpm=None, seed=0) -> None:
+        super().__init__(address, StubHandler)
+        self.dim = dim
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.random = np.random.default_rng(seed)
+        self.recent = deque()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rejected = 0
+        self.inputs = 0
+
+    # True if this request should get a 429
+    def reject(self):
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            while self.recent and self.recent[0] < now - 60:
+                self.recent.popleft()
+            limited = self.rpm is not None and len(self.recent) >= self.rpm
+            if limited or self.random.random() < self.error_rate:
+                self.rejected += 1
+                return True
+            self.recent.append(now)
+            return False
+
+    def stats(self):
+        return {"requests": self.requests, "rejected": self.rejected, "inputs": self.inputs}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, body, headers=()):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if not self.path.rstrip("/").endswith("/embeddings"):
+            return self.send_json(404, {"error": {"message": f"no route {self.path}"}})
+
+        server = self.server
+        if server.reject():
+            return self.send_json(429, {"error": {"message": "rate limited"}}, [("Retry-After", "0.05")])
+        time.sleep(server.latency)
+
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        with server.lock:
+            server.inputs += len(texts)
+        self.send_json(200, {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub_embedding(text, server.dim)}
+                for i, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def do_GET(self):
+        self.send_json(200, self.server.stats())
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Start a stub in a background thread (port 0 picks a free one), returns the server
+# and its base_url
+def start_stub(port=0, **options):
+    server = StubServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenAI embeddings endpoint")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--rpm", type=int, default=None, help="429 above this many requests per minute")
+    args = parser.parse_args()
+    server = StubServer(("127.0.0.1", args.port), args.dim, args.latency, args.error_rate, args.rpm)
+    print(f"Stub embeddings on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
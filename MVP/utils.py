@@ -0,0 +1,40 @@
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+data_folder = Path("./data")
+
+
+# sha256 of a file, or of its first size bytes
+def file_hash(path, size=None):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read(size)).hexdigest()
+
+
+# np.savez to a temp file next to path, then renamed over it, so a reader (another
+# server worker rebuilding the same artifact) never opens a half written .npz
+def save_npz(path, **arrays):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(tmp, path)
+
+
+# Economic data around a date like data/example_jessie.json, {FRED series: [value
+# at +0, +180, +365, +545, +730 days]}. Given a list of dates, all of them are
+# looked up in one pass and a list of those dicts comes back.
+def add_economic_data(dates):
+    from economic_data import SERIES, event_economic_data
+
+    single = not isinstance(dates, (list, tuple)) and getattr(dates, "ndim", 0) == 0
+    values = event_economic_data([dates] if single else dates)
+    values = values.reshape(len(values), len(SERIES), -1)
+    events = [dict(zip(SERIES.values(), row.tolist())) for row in values]
+    return events[0] if single else events
+
+
+# One event's economic data as a flat vector, series after series
+def flatten_event_data(data):
+    return np.concatenate([np.asarray(values, dtype=float) for key, values in data.items() if key != "DATE"])
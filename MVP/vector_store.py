@@ -0,0 +1,197 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+# Exact vector search over a float32 embedding matrix kept in a .npy file (memory
+# mapped) next to a json side table with the ids, documents and metadata.
+# For a few thousand events one matrix-vector product is faster than going through
+# Chroma, so this implements the part of the chromadb Collection API that
+# load_data and extract_information use (add/upsert/delete/get/query/count/modify).
+#
+# space="l2" reports squared L2 distances like a default Chroma collection, so the
+# 1 / (1 + distance) scores in query_data don't change when switching backends.
+# space="cosine" reports 1 - cosine similarity.
+class NumpyCollection:
+    def __init__(self, path="vector_store", embedding_function=None, space="l2") -> None:
+        if space not in ("l2", "cosine"):
+            raise ValueError(f"Unsupported space {space!r}, expected 'l2' or 'cosine'")
+        self.path = Path(path)
+        self.embedding_function = embedding_function
+        self.space = space
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def embeddings_file(self):
+        return self.path / "embeddings.npy"
+
+    @property
+    def records_file(self):
+        return self.path / "records.json"
+
+    # (mtime, size) of records.json, it's replaced last when the store is saved
+    def _stamp(self):
+        try:
+            stat = self.records_file.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        stamp = self._stamp()
+        if stamp is not None:
+            records = json.loads(self.records_file.read_text())
+            embeddings = np.load(self.embeddings_file, mmap_mode="r")
+        else:
+            records = {"ids": [], "documents": [], "metadatas": [], "metadata": {}}
+            embeddings = np.empty((0, 0), dtype=np.float32)
+        self._set(records, embeddings)
+        self._loaded_stamp = stamp
+
+    # Re-read the store if another process (load_data.py) saved it since it was
+    # loaded, returns True if it did
+    def refresh(self):
+        stamp = self._stamp()
+        if stamp is None or stamp == self._loaded_stamp:
+            return False
+        with self._lock:
+            records = json.loads(self.records_file.read_text())
+            embeddings = np.load(self.embeddings_file, mmap_mode="r")
+            if len(records["ids"]) != len(embeddings):
+                # caught between the two os.replace calls of a save, next time
+                return False
+            self._set(records, embeddings)
+            self._loaded_stamp = stamp
+        return True
+
+    def _set(self, records, embeddings):
+        self._records = records
+        self._embeddings = embeddings
+        self._index = {id: i for i, id in enumerate(records["ids"])}
+        self._sq_norms = np.einsum("ij,ij->i", embeddings, embeddings, dtype=np.float32)
+
+    def _save(self, records, embeddings):
+        self.path.mkdir(parents=True, exist_ok=True)
+        # write to temp files first, so readers never see half a store
+        tmp_embeddings = self.path / "embeddings.tmp.npy"
+        tmp_records = self.path / "records.tmp.json"
+        np.save(tmp_embeddings, np.ascontiguousarray(embeddings, dtype=np.float32))
+        tmp_records.write_text(json.dumps(records))
+        os.replace(tmp_embeddings, self.embeddings_file)
+        os.replace(tmp_records, self.records_file)
+        self._set(records, np.load(self.embeddings_file, mmap_mode="r"))
+        self._loaded_stamp = self._stamp()
+
+    def _embed(self, documents, embeddings):
+        if embeddings is None:
+            if self.embedding_function is None:
+                raise ValueError("No embeddings given and no embedding_function set")
+            embeddings = self.embedding_function(list(documents))
+        return np.asarray(np.vstack(embeddings), dtype=np.float32)
+
+    @property
+    def metadata(self):
+        return self._records["metadata"]
+
+    def modify(self, name=None, metadata=None):
+        if metadata is not None:
+            with self._lock:
+                self._save({**self._records, "metadata": dict(metadata)}, self._embeddings)
+
+    def count(self):
+        return len(self._records["ids"])
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None):
+        new_embeddings = self._embed(documents, embeddings)
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+
+        with self._lock:
+            records = {
+                "ids": list(self._records["ids"]),
+                "documents": list(self._records["documents"]),
+                "metadatas": list(self._records["metadatas"]),
+                "metadata": self._records["metadata"],
+            }
+            if self.count():
+                embeddings = np.array(self._embeddings, dtype=np.float32)
+            else:
+                embeddings = np.empty((0, new_embeddings.shape[1]), dtype=np.float32)
+
+            new_rows = []
+            for id, document, metadata, vector in zip(ids, documents, metadatas, new_embeddings):
+                i = self._index.get(id)
+                if i is None:
+                    records["ids"].append(id)
+                    records["documents"].append(document)
+                    records["metadatas"].append(metadata)
+                    new_rows.append(vector)
+                    continue
+                embeddings[i] = vector
+                if document is not None:
+                    records["documents"][i] = document
+                if metadata is not None:
+                    records["metadatas"][i] = metadata
+
+            if new_rows:
+                embeddings = np.vstack([embeddings, *new_rows])
+            self._save(records, embeddings)
+
+    add = upsert
+
+    def delete(self, ids):
+        with self._lock:
+            drop = {self._index[id] for id in ids if id in self._index}
+            keep = [i for i in range(self.count()) if i not in drop]
+            records = {
+                key: [value[i] for i in keep]
+                for key, value in self._records.items()
+                if key != "metadata"
+            }
+            records["metadata"] = self._records["metadata"]
+            self._save(records, np.asarray(self._embeddings)[keep])
+
+    def get(self, ids=None, include=("metadatas", "documents")):
+        records = self._records
+        rows = range(self.count()) if ids is None else [self._index[id] for id in ids if id in self._index]
+        result = {"ids": [records["ids"][i] for i in rows]}
+        for field in ("metadatas", "documents"):
+            result[field] = [records[field][i] for i in rows] if field in include else None
+        return result
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, include=None):
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts))
+        queries = np.asarray(np.vstack(query_embeddings), dtype=np.float32)
+
+        records, embeddings, sq_norms = self._records, self._embeddings, self._sq_norms
+        k = min(n_results, len(records["ids"]))
+        if k == 0:
+            empty = [[] for _ in queries]
+            return {"ids": empty, "distances": empty, "metadatas": empty, "documents": empty}
+
+        # one BLAS product for all queries against all stored embeddings
+        dots = queries @ embeddings.T
+        query_sq_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        if self.space == "l2":
+            distances = np.maximum(sq_norms[None, :] + query_sq_norms - 2 * dots, 0)
+        else:
+            norms = np.sqrt(sq_norms[None, :] * query_sq_norms)
+            distances = 1 - dots / np.where(norms == 0, 1, norms)
+
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        top_distances = np.take_along_axis(distances, top, axis=1)
+        order = np.argsort(top_distances, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_distances = np.take_along_axis(top_distances, order, axis=1)
+
+        return {
+            "ids": [[records["ids"][i] for i in row] for row in top],
+            "distances": top_distances.tolist(),
+            "metadatas": [[records["metadatas"][i] for i in row] for row in top],
+            "documents": [[records["documents"][i] for i in row] for row in top],
+        }